@@ -1,7 +1,10 @@
-
 import streamlit as st
-import pandas as pd
-import joblib
+# Preprocessing and scoring live in inference.py (no Streamlit imports); re-exported here for
+# existing callers. Nothing is loaded until the first prediction.
+from inference import (
+    predict_transaction, predict_transactions, build_feature_matrix,
+    categorical_cols_for_ohe, numerical_cols_to_scale, final_model_features
+)
 # Import database functions from utils.py
 from utils import get_db_connection, initialize_database, create_user, authenticate_user, reset_user_password
 
@@ -10,73 +13,6 @@ if 'db_initialized' not in st.session_state:
     initialize_database()
     st.session_state.db_initialized = True
 
-# --- Model and Scaler Loading (existing functions) ---
-@st.cache_resource
-def load_model_and_scaler():
-    model = joblib.load('./random_forest_model.joblib')
-    scaler = joblib.load('./scaler.joblib')
-    return model, scaler
-
-model, scaler = load_model_and_scaler()
-
-# --- Preprocessing Column Definitions (existing definitions) ---
-categorical_cols_for_ohe = [
-    'Transaction_Location',
-    'Card_Type',
-    'Transaction_Currency',
-    'Transaction_Status',
-    'Authentication_Method',
-    'Transaction_Category'
-]
-
-numerical_cols_to_scale = [
-    'Transaction_Amount',
-    'Previous_Transaction_Count',
-    'Distance_Between_Transactions_km',
-    'Time_Since_Last_Transaction_min',
-    'Transaction_Velocity'
-]
-
-final_model_features = [
-    'Transaction_Amount', 'Previous_Transaction_Count', 'Distance_Between_Transactions_km',
-    'Time_Since_Last_Transaction_min', 'Transaction_Velocity', 'Transaction_Hour',
-    'Transaction_DayOfWeek', 'Transaction_Month',
-    'Transaction_Location_Bukhara', 'Transaction_Location_Fergana', 'Transaction_Location_Jizzakh',
-    'Transaction_Location_Kashkadarya', 'Transaction_Location_Khorezm', 'Transaction_Location_Namangan',
-    'Transaction_Location_Navoiy', 'Transaction_Location_Samarkand', 'Transaction_Location_Sirdarya',
-    'Transaction_Location_Surkhandarya', 'Transaction_Location_Tashkent',
-    'Card_Type_UzCard', 'Transaction_Currency_UZS',
-    'Transaction_Status_Reversed', 'Transaction_Status_Successful',
-    'Authentication_Method_Biometric', 'Authentication_Method_Password',
-    'Transaction_Category_Cash Out', 'Transaction_Category_Payment', 'Transaction_Category_Transfer'
-]
-
-# --- Prediction Function (existing function) ---
-def predict_transaction(raw_input_data):
-    df_single = pd.DataFrame([raw_input_data])
-
-    # 1. Date/Time Feature Engineering
-    df_single['Transaction_DateTime'] = pd.to_datetime(df_single['Transaction_Date'] + ' ' + df_single['Transaction_Time'], format='%m/%d/%Y %H:%M')
-    df_single['Transaction_Hour'] = df_single['Transaction_DateTime'].dt.hour
-    df_single['Transaction_DayOfWeek'] = df_single['Transaction_DateTime'].dt.dayofweek
-    df_single['Transaction_Month'] = df_single['Transaction_DateTime'].dt.month
-    df_single = df_single.drop(columns=['Transaction_Date', 'Transaction_Time', 'Transaction_DateTime'])
-
-    # 2. One-Hot Encoding
-    df_single = pd.get_dummies(df_single, columns=categorical_cols_for_ohe, drop_first=True)
-
-    # 3. Align columns with the training data (X_train)
-    df_single = df_single.reindex(columns=final_model_features, fill_value=0)
-
-    # 4. Scale numerical features
-    df_single[numerical_cols_to_scale] = scaler.transform(df_single[numerical_cols_to_scale])
-
-    # Make prediction
-    prediction = model.predict(df_single)[0]
-    prob = model.predict_proba(df_single)[0][1]
-
-    return "Fraud" if prediction == 1 else "Legit", round(prob, 4)
-
 # --- Streamlit App Interface - Overview Page ---
 st.set_page_config(page_title="Fraud Detection App", layout="wide")
 
@@ -0,0 +1,187 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import utils
+
+# --- Write-Behind Prediction Audit Log ---
+# Predictions are enqueued in memory and written to the transactions table by a background
+# thread, in executemany batches flushed when either AUDIT_FLUSH_SIZE records are pending or
+# AUDIT_FLUSH_INTERVAL_S has passed. Scoring therefore never waits on SQLite or fsync.
+# The queue is bounded: when it is full new records are dropped (and counted) rather
+# than blocking the prediction.
+# A batch that fails is halved until the bad records are isolated, so one invalid record (e.g.
+# for a deleted user) fails alone instead of taking other users' records with it. A locked or
+# busy database is retried with backoff rather than counted as a failure.
+
+AUDIT_QUEUE_SIZE = 100000
+AUDIT_FLUSH_SIZE = 500
+AUDIT_FLUSH_INTERVAL_S = 0.5
+AUDIT_BUSY_RETRIES = 5
+AUDIT_BUSY_BACKOFF_S = 0.1
+
+logger = logging.getLogger(__name__)
+
+class AuditLogWriter:
+    def __init__(self, queue_size=AUDIT_QUEUE_SIZE, flush_size=AUDIT_FLUSH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL_S):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_error = None
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def log_prediction(self, user_id, timestamp, raw_input, prediction, probability):
+        # raw_input is kept as a dict here; JSON encoding happens on the writer thread
+        try:
+            self._queue.put_nowait((user_id, timestamp, raw_input, prediction, float(probability)))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def flush(self, timeout=2.0):
+        # Blocks until everything enqueued before this call has been written (or timeout)
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def shutdown(self, timeout=5.0):
+        # Drains the queue before the writer thread exits
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'last_error': self.last_error,
+                'flushes': self.flushes,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            }
+
+    def _run(self):
+        pending = []
+        waiters = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    pending.append(item)
+            except queue.Empty:
+                pass
+
+            stopping = self._stopping.is_set()
+            if stopping:
+                # Pull everything still queued into this final flush
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    (waiters if isinstance(item, threading.Event) else pending).append(item)
+
+            if len(pending) >= self.flush_size or waiters or stopping or time.monotonic() >= deadline:
+                if pending:
+                    self._write(pending)
+                    pending = []
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+                deadline = time.monotonic() + self.flush_interval
+                if stopping:
+                    return
+
+    def _write(self, records):
+        start = time.perf_counter()
+        conn = None
+        try:
+            conn = utils.get_db_connection()
+            written, failed = self._insert(conn, records)
+        except Exception as e:
+            # Nothing raised here (not even no connection) stops the writer thread, so later
+            # records and flush() still work
+            logger.exception("Audit log failed to write %d records", len(records))
+            written, failed = 0, len(records)
+            self._record_error(e)
+        finally:
+            if conn:
+                conn.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with self._lock:
+            self.written += written
+            self.failed += failed
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+
+    def _insert(self, conn, records):
+        # Returns (written, failed). insert_transactions is one transaction, so a failed attempt
+        # leaves nothing behind and each half can be retried on its own.
+        for attempt in range(AUDIT_BUSY_RETRIES + 1):
+            try:
+                utils.insert_transactions(conn, records)
+                return len(records), 0
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    return self._insert_halves(conn, records, e)
+                if attempt == AUDIT_BUSY_RETRIES:
+                    logger.error("Audit log gave up on %d records: database still busy (%s)", len(records), e)
+                    self._record_error(e)
+                    return 0, len(records)
+                time.sleep(AUDIT_BUSY_BACKOFF_S * 2 ** attempt)
+            except Exception as e:
+                # SQLite constraint errors, or a raw_input that cannot be JSON-encoded
+                return self._insert_halves(conn, records, e)
+
+    def _insert_halves(self, conn, records, error):
+        if len(records) == 1:
+            logger.error("Audit log dropped a record for user %s: %s: %s", records[0][0], type(error).__name__, error)
+            self._record_error(error)
+            return 0, 1
+        middle = len(records) // 2
+        written_a, failed_a = self._insert(conn, records[:middle])
+        written_b, failed_b = self._insert(conn, records[middle:])
+        return written_a + written_b, failed_a + failed_b
+
+    def _record_error(self, error):
+        with self._lock:
+            self.last_error = f"{type(error).__name__}: {error}"
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_audit_log():
+    # Process-wide writer, started on first use and drained at interpreter exit
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditLogWriter()
+            atexit.register(_writer.shutdown)
+        return _writer
@@ -0,0 +1,329 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import utils
+from fingerprints import file_fingerprint
+from inference import (build_feature_matrix, categorical_cols_for_ohe, final_model_features, load_model_version,
+                       numerical_cols_to_scale, version_artifact_paths)
+
+# --- Historical Replay / Backtest ---
+# Replays stored inputs through two model versions side by side and reports how the decisions
+# would have differed:
+#   source   the transactions table (typed input columns, keyset-paged by id) or a card_fraud.csv-
+#            schema file through the memory-mapped dataset cache (sliced by row index)
+#   models   'root' (random_forest_model.joblib + scaler.joblib), a models/<version> name from
+#            train_model.py, or any directory holding those two files
+# Each batch is preprocessed once per distinct scaler and scored with one predict_proba call per
+# model, on all cores. The report has flipped decisions in both directions, the distribution of
+# the fraud-probability shift (B - A), the A x B decision matrix and, for labelled CSV rows, each
+# model's confusion matrix and their delta. Accumulated state and the source position are
+# checkpointed every few batches, so an interrupted replay continues with --resume.
+
+BACKTEST_BATCH_SIZE = 50000
+BACKTEST_CHECKPOINT_PATH = 'backtest_checkpoint.json'
+BACKTEST_REPORT_PATH = 'backtest_report.json'
+CHECKPOINT_EVERY_BATCHES = 10
+CHECKPOINT_VERSION = 2
+SHIFT_BIN_EDGES = np.linspace(-1.0, 1.0, 201)   # 0.01-wide bins over the probability shift
+TOP_FLIPS = 20
+label_col = 'isFraud'
+replay_input_columns = ['Transaction_Date', 'Transaction_Time'] + numerical_cols_to_scale + categorical_cols_for_ohe
+
+# --- Models ---
+def load_replay_model(spec):
+    model, scaler = load_model_version(spec)
+    model.n_jobs = -1
+    model_file = version_artifact_paths(spec)[0]
+    return model, scaler, {'spec': spec or 'root', 'model_file': model_file, **file_fingerprint(model_file)}
+
+def _same_scaler(scaler_a, scaler_b):
+    return scaler_a is scaler_b or (np.array_equal(scaler_a.mean_, scaler_b.mean_) and
+                                    np.array_equal(scaler_a.scale_, scaler_b.scale_))
+
+# --- Sources ---
+# Each yields (position after the batch, row keys, raw column dict, labels or None, skipped rows)
+def iter_dataset_batches(csv_path, batch_size=BACKTEST_BATCH_SIZE, start=0):
+    arrays, categories = dataset.load_columns(replay_input_columns + [label_col], csv_path)
+    categories = {col: np.asarray(values, dtype=object) for col, values in categories.items()}
+    n_rows = len(arrays[label_col])
+    for batch_start in range(start, n_rows, batch_size):
+        batch_end = min(batch_start + batch_size, n_rows)
+        columns = {}
+        for col in replay_input_columns:
+            values = np.asarray(arrays[col][batch_start:batch_end])
+            columns[col] = categories[col][values] if col in categories else values
+        labels = np.asarray(arrays[label_col][batch_start:batch_end]).astype(np.int8)
+        yield batch_end, np.arange(batch_start, batch_end), columns, labels, 0
+
+def iter_history_batches(conn, batch_size=BACKTEST_BATCH_SIZE, after_id=0, user_id=None):
+    # Keyset pagination on the primary key: every batch is a range scan, whatever the table size
+    where, params = "id > ?", []
+    if user_id is not None:
+        where += " AND user_id = ?"
+        params.append(user_id)
+    while True:
+        rows = conn.execute(
+            f"SELECT id, {', '.join(replay_input_columns)} FROM transactions WHERE {where} ORDER BY id LIMIT ?",
+            [after_id] + params + [batch_size]
+        ).fetchall()
+        if not rows:
+            return
+        values = list(zip(*rows))
+        ids = np.asarray(values[0], dtype=np.int64)
+        columns = {col: np.asarray(column_values, dtype=object)
+                   for col, column_values in zip(replay_input_columns, values[1:])}
+        # Rows saved before every field was captured cannot be preprocessed; they are counted as skipped
+        complete = np.ones(len(ids), dtype=bool)
+        for col in replay_input_columns:
+            complete &= np.asarray([value is not None for value in columns[col]])
+        columns = {col: (values[complete].astype(np.float64) if col in numerical_cols_to_scale else values[complete])
+                   for col, values in columns.items()}
+        after_id = int(ids[-1])
+        yield after_id, ids[complete], columns, None, int(len(ids) - complete.sum())
+
+# --- Accumulated Statistics ---
+class BacktestStats:
+    def __init__(self):
+        self.rows = 0
+        self.skipped = 0
+        self.decisions = np.zeros((2, 2), dtype=np.int64)          # [A legit/fraud][B legit/fraud]
+        self.confusion_a = np.zeros((2, 2), dtype=np.int64)        # [actual][predicted]
+        self.confusion_b = np.zeros((2, 2), dtype=np.int64)
+        self.labelled_rows = 0
+        self.shift_counts = np.zeros(len(SHIFT_BIN_EDGES) - 1, dtype=np.int64)
+        self.shift_sum = 0.0
+        self.abs_shift_sum = 0.0
+        self.max_abs_shift = 0.0
+        self.top_flips = []                                        # [abs shift, key, proba A, proba B]
+
+    def update(self, keys, fraud_a, fraud_b, proba_a, proba_b, labels=None):
+        self.rows += len(keys)
+        np.add.at(self.decisions, (fraud_a.astype(np.int64), fraud_b.astype(np.int64)), 1)
+        if labels is not None:
+            self.labelled_rows += len(labels)
+            np.add.at(self.confusion_a, (labels.astype(np.int64), fraud_a.astype(np.int64)), 1)
+            np.add.at(self.confusion_b, (labels.astype(np.int64), fraud_b.astype(np.int64)), 1)
+        shift = proba_b - proba_a
+        self.shift_counts += np.histogram(np.clip(shift, -1.0, 1.0), bins=SHIFT_BIN_EDGES)[0]
+        self.shift_sum += float(shift.sum())
+        abs_shift = np.abs(shift)
+        self.abs_shift_sum += float(abs_shift.sum())
+        if len(shift):
+            self.max_abs_shift = max(self.max_abs_shift, float(abs_shift.max()))
+
+        flipped = np.flatnonzero(fraud_a != fraud_b)
+        if len(flipped):
+            largest = flipped[np.argsort(-abs_shift[flipped], kind='stable')[:TOP_FLIPS]]
+            self.top_flips += [[float(abs_shift[i]), int(keys[i]), float(proba_a[i]), float(proba_b[i])] for i in largest]
+            self.top_flips = sorted(self.top_flips, key=lambda flip: -flip[0])[:TOP_FLIPS]
+
+    def to_dict(self):
+        return {name: value.tolist() if isinstance(value, np.ndarray) else value for name, value in vars(self).items()}
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls()
+        for name, value in state.items():
+            current = getattr(stats, name)
+            setattr(stats, name, np.asarray(value, dtype=current.dtype) if isinstance(current, np.ndarray) else value)
+        return stats
+
+    def _abs_shift_quantile(self, q):
+        # Fold the signed histogram onto |shift|; returns the upper edge of the bin holding the quantile
+        half = len(self.shift_counts) // 2
+        abs_counts = self.shift_counts[half:] + self.shift_counts[:half][::-1]
+        if not abs_counts.sum():
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(abs_counts), q * abs_counts.sum()))
+        return round(float(SHIFT_BIN_EDGES[half + idx + 1]), 2)
+
+    def report(self):
+        rows = max(self.rows, 1)
+        legit_to_fraud, fraud_to_legit = int(self.decisions[0, 1]), int(self.decisions[1, 0])
+        report = {
+            'rows': self.rows,
+            'skipped_rows': self.skipped,
+            'flipped': legit_to_fraud + fraud_to_legit,
+            'flipped_legit_to_fraud': legit_to_fraud,
+            'flipped_fraud_to_legit': fraud_to_legit,
+            'flip_rate': round((legit_to_fraud + fraud_to_legit) / rows, 6),
+            'fraud_rate_a': round(float(self.decisions[1].sum()) / rows, 6),
+            'fraud_rate_b': round(float(self.decisions[:, 1].sum()) / rows, 6),
+            'decision_matrix': {'rows': 'A legit/fraud', 'columns': 'B legit/fraud', 'counts': self.decisions.tolist()},
+            'probability_shift': {
+                'mean': round(self.shift_sum / rows, 6),
+                'mean_abs': round(self.abs_shift_sum / rows, 6),
+                'max_abs': round(self.max_abs_shift, 4),
+                'abs_p50': self._abs_shift_quantile(0.50),
+                'abs_p95': self._abs_shift_quantile(0.95),
+                'abs_p99': self._abs_shift_quantile(0.99),
+                'bin_edges': [round(float(edge), 2) for edge in SHIFT_BIN_EDGES],
+                'counts': self.shift_counts.tolist(),
+            },
+            'top_flips': [{'key': key, 'proba_a': round(proba_a, 4), 'proba_b': round(proba_b, 4)}
+                          for _, key, proba_a, proba_b in self.top_flips],
+        }
+        if self.labelled_rows:
+            report['confusion'] = {
+                'layout': '[actual legit/fraud][predicted legit/fraud]',
+                'a': _confusion_summary(self.confusion_a),
+                'b': _confusion_summary(self.confusion_b),
+                'delta': (self.confusion_b - self.confusion_a).tolist(),
+            }
+        return report
+
+def _confusion_summary(matrix):
+    true_positives = int(matrix[1, 1])
+    return {
+        'counts': matrix.tolist(),
+        'recall': round(true_positives / max(int(matrix[1].sum()), 1), 4),
+        'precision': round(true_positives / max(int(matrix[:, 1].sum()), 1), 4),
+    }
+
+# --- Replay ---
+def _fraud_decisions(model, features):
+    proba = model.predict_proba(pd.DataFrame(features, columns=final_model_features))
+    classes = model.classes_
+    # Same decision rule as serving (inference.labels_from_proba): the most probable class
+    return classes.take(np.argmax(proba, axis=1)) == 1, proba[:, list(classes).index(1)]
+
+def _save_checkpoint(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def run_backtest(model_a, model_b, csv_path=None, user_id=None, batch_size=BACKTEST_BATCH_SIZE,
+                 checkpoint_path=BACKTEST_CHECKPOINT_PATH, resume=False, flips_path=None, max_rows=None, progress=None):
+    """Replay a CSV (or, without one, utils.DB_FILE) through models A and B and return the diff report."""
+    model_a, scaler_a, info_a = load_replay_model(model_a)
+    model_b, scaler_b, info_b = load_replay_model(model_b)
+    share_features = _same_scaler(scaler_a, scaler_b)
+    source = {'csv_path': csv_path, **file_fingerprint(csv_path)} if csv_path else {'db_file': utils.DB_FILE, 'user_id': user_id}
+    identity = {'source': source, 'model_a': info_a, 'model_b': info_b}
+
+    stats, position, elapsed, flips_offset = BacktestStats(), 0, 0.0, None
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint['identity'] != identity:
+            raise ValueError(f"{checkpoint_path} belongs to a different replay (source or models changed)")
+        stats, position, elapsed = BacktestStats.from_dict(checkpoint['stats']), checkpoint['position'], checkpoint['elapsed_s']
+        flips_offset = checkpoint.get('flips_offset')
+
+    conn = None
+    if csv_path:
+        batches = iter_dataset_batches(csv_path, batch_size, start=position)
+    else:
+        conn = utils.get_db_connection()
+        batches = iter_history_batches(conn, batch_size, after_id=position, user_id=user_id)
+
+    flips_file = None
+    if flips_path:
+        if resume and position and flips_offset is not None and os.path.exists(flips_path):
+            # Rows written after the checkpoint are replayed again, so drop them first
+            flips_file = open(flips_path, 'r+', newline='')
+            flips_file.truncate(flips_offset)
+            flips_file.seek(flips_offset)
+        else:
+            flips_file = open(flips_path, 'a' if resume and position else 'w', newline='')
+        flips_writer = csv.writer(flips_file)
+        if not (resume and position):
+            flips_writer.writerow(['key', 'decision_a', 'decision_b', 'proba_a', 'proba_b', 'actual'])
+
+    def checkpoint():
+        offset = None
+        if flips_file is not None:
+            flips_file.flush()
+            offset = flips_file.tell()
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, {'version': CHECKPOINT_VERSION, 'identity': identity, 'position': position,
+                                               'elapsed_s': elapsed, 'stats': stats.to_dict(), 'flips_offset': offset})
+
+    # True while a batch is being applied to stats, the flips file and position; an interrupt
+    # then leaves them inconsistent, and the last periodic checkpoint is kept instead
+    applying = False
+    try:
+        started = time.perf_counter() - elapsed
+        for batch_number, (next_position, keys, columns, labels, skipped) in enumerate(batches, start=1):
+            # A page of incomplete rows leaves nothing to score, but its position still advances
+            if len(keys):
+                features_a = build_feature_matrix(columns, scaler=scaler_a)
+                features_b = features_a if share_features else build_feature_matrix(columns, scaler=scaler_b)
+                fraud_a, proba_a = _fraud_decisions(model_a, features_a)
+                fraud_b, proba_b = _fraud_decisions(model_b, features_b)
+
+            applying = True
+            stats.skipped += skipped
+            if len(keys):
+                stats.update(keys, fraud_a, fraud_b, proba_a, proba_b, labels)
+                if flips_file is not None:
+                    for i in np.flatnonzero(fraud_a != fraud_b):
+                        flips_writer.writerow([int(keys[i]), 'Fraud' if fraud_a[i] else 'Legit', 'Fraud' if fraud_b[i] else 'Legit',
+                                               round(float(proba_a[i]), 4), round(float(proba_b[i]), 4),
+                                               int(labels[i]) if labels is not None else ''])
+            position = next_position
+            applying = False
+            elapsed = time.perf_counter() - started
+            if progress:
+                progress(stats.rows, elapsed)
+            if batch_number % CHECKPOINT_EVERY_BATCHES == 0:
+                checkpoint()
+            if max_rows and stats.rows >= max_rows:
+                break
+        checkpoint()
+    except KeyboardInterrupt:
+        # Save progress up to the last whole batch so --resume continues from there
+        if not applying:
+            checkpoint()
+        raise
+    finally:
+        if flips_file is not None:
+            flips_file.close()
+        if conn is not None:
+            conn.close()
+
+    report = {'model_a': info_a['spec'], 'model_b': info_b['spec'], 'source': source, 'position': position,
+              **stats.report()}
+    report['elapsed_s'] = round(elapsed, 2)
+    report['rows_per_s'] = round(stats.rows / elapsed, 1) if elapsed else None
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay stored transactions through two model versions and diff them")
+    parser.add_argument('--model-a', default='root', help="'root', a models/<version> name or a directory (default: root)")
+    parser.add_argument('--model-b', required=True, help="Candidate model, same forms as --model-a")
+    parser.add_argument('--csv', help="Replay a card_fraud.csv-schema file (labelled) instead of the transactions table")
+    parser.add_argument('--db', default=utils.DB_FILE)
+    parser.add_argument('--user-id', type=int, help="Only this user's stored transactions")
+    parser.add_argument('--batch-size', type=int, default=BACKTEST_BATCH_SIZE)
+    parser.add_argument('--max-rows', type=int, help="Stop after about this many rows (a resumable partial run)")
+    parser.add_argument('--checkpoint', default=BACKTEST_CHECKPOINT_PATH)
+    parser.add_argument('--resume', action='store_true', help="Continue from --checkpoint")
+    parser.add_argument('--flips', help="Also write every flipped row to this CSV")
+    parser.add_argument('--output', default=BACKTEST_REPORT_PATH)
+    args = parser.parse_args()
+
+    utils.DB_FILE = args.db
+
+    def print_progress(rows, elapsed):
+        print(f"\r{rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)", end='', flush=True)
+
+    report = run_backtest(args.model_a, args.model_b, csv_path=args.csv, user_id=args.user_id,
+                          batch_size=args.batch_size, checkpoint_path=args.checkpoint, resume=args.resume,
+                          flips_path=args.flips, max_rows=args.max_rows, progress=print_progress)
+    print()
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    summary = {key: value for key, value in report.items() if key not in ('probability_shift', 'top_flips', 'source')}
+    summary['probability_shift'] = {key: value for key, value in report['probability_shift'].items()
+                                    if key not in ('bin_edges', 'counts')}
+    print(json.dumps(summary, indent=2))
+    print(f"Wrote {args.output}")
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import eda_stats
+import inference
+import synthetic_data
+import utils
+
+# --- Performance Benchmark Suite ---
+# Measures the paths that matter for latency SLOs on synthetic data (synthetic_data.py), so runs
+# are repeatable on any machine:
+#   scoring     single-row predict_transaction latency percentiles, batch throughput by batch size
+#   database    insert rate and history-query latency as the transactions table grows
+#   eda         cold summary build vs. warm sidecar load for the EDA page
+#   cold_start  fresh-process import + model/scaler load + first prediction
+# Results are written as JSON. With --baseline, metrics are compared against a previous
+# results file and the run exits non-zero when one regresses by more than --tolerance. Tail
+# latencies rest on a handful of samples and swing with any scheduler hiccup: p99 gets the wider
+# --tail-tolerance and max is reported but never compared.
+# Metric names carry their direction: *_ms is lower-is-better, *_per_s is higher-is-better.
+
+BENCHMARK_SUITES = ['scoring', 'database', 'eda', 'cold_start']
+BENCHMARK_RESULTS_PATH = 'benchmark_results.json'
+REGRESSION_TOLERANCE = 0.15
+TAIL_REGRESSION_TOLERANCE = 0.5
+TAIL_METRICS = ('p99_ms',)
+UNCOMPARED_METRICS = ('max_ms',)
+
+# Sizes for a full run; --quick shrinks them for a smoke check
+FULL_SIZES = {
+    'single_row_samples': 2000,
+    'batch_sizes': [1, 8, 64, 512, 4096, 32768],
+    'batch_rows': 65536,
+    'db_table_sizes': [10000, 100000, 1000000],
+    'db_users': 100,
+    'db_query_samples': 200,
+    'eda_rows': 1000000,
+    'cold_start_runs': 5,
+}
+QUICK_SIZES = {
+    'single_row_samples': 200,
+    'batch_sizes': [1, 64, 4096],
+    'batch_rows': 8192,
+    'db_table_sizes': [1000, 10000],
+    'db_users': 10,
+    'db_query_samples': 50,
+    'eda_rows': 50000,
+    'cold_start_runs': 2,
+}
+
+def latency_summary(samples_s):
+    samples_ms = np.asarray(samples_s) * 1000.0
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {
+        'samples': len(samples_ms),
+        'mean_ms': round(float(samples_ms.mean()), 4),
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'max_ms': round(float(samples_ms.max()), 4),
+    }
+
+# --- Scoring ---
+def bench_scoring(sizes, seed):
+    inference.get_model()
+    inference.get_scaler()
+    prediction_cache = inference.get_prediction_cache()
+    results = {'engine': 'flat_forest' if inference.get_flat_forest() is not None else 'sklearn'}
+
+    # Distinct rows, so the prediction cache does not turn the measurement into dict lookups
+    records = synthetic_data.raw_input_records(
+        synthetic_data.generate_transactions(sizes['single_row_samples'], seed=seed))
+    prediction_cache.clear()
+    inference.predict_transaction(records[0])  # warm-up
+    samples = []
+    for record in records:
+        start = time.perf_counter()
+        inference.predict_transaction(record)
+        samples.append(time.perf_counter() - start)
+    results['single_row'] = latency_summary(samples)
+
+    batch_frame = synthetic_data.generate_transactions(sizes['batch_rows'], seed=seed + 1)
+    results['batch'] = {}
+    for batch_size in sizes['batch_sizes']:
+        batches = [batch_frame.iloc[start:start + batch_size] for start in range(0, len(batch_frame), batch_size)]
+        # Enough batches for a stable number without running tiny batches over the whole frame
+        batches = batches[:max(3, 2048 // batch_size)]
+        inference.predict_transactions(batches[0], use_cache=False)
+        samples = []
+        for batch in batches:
+            start = time.perf_counter()
+            inference.predict_transactions(batch, use_cache=False)
+            samples.append(time.perf_counter() - start)
+        rows = sum(len(batch) for batch in batches)
+        results['batch'][str(batch_size)] = {
+            **latency_summary(samples),
+            'rows_per_s': round(rows / sum(samples), 1),
+        }
+    return results
+
+# --- Database ---
+def bench_database(sizes, seed):
+    tmp_dir = tempfile.mkdtemp(prefix='fraud_bench_db_')
+    original_db_file = utils.DB_FILE
+    utils.DB_FILE = os.path.join(tmp_dir, 'bench.db')
+    results = {}
+    try:
+        utils.initialize_database()
+        conn = utils.get_db_connection()
+        with conn:
+            conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                             [(f'bench_user_{idx}', '') for idx in range(sizes['db_users'])])
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+        rng = np.random.default_rng(seed)
+        base_time = datetime(2024, 1, 1)
+
+        table_size = 0
+        for target_size in sizes['db_table_sizes']:
+            n_new = target_size - table_size
+            frame = synthetic_data.generate_transactions(n_new, seed=seed + target_size)
+            records = synthetic_data.raw_input_records(frame)
+            owners = rng.choice(user_ids, n_new)
+            offsets = rng.integers(0, 365 * 24 * 3600, n_new)
+            rows = [
+                (int(owner), (base_time + timedelta(seconds=int(offset))).isoformat(), record, 'Legit', 0.1)
+                for owner, offset, record in zip(owners, offsets, records)
+            ]
+            insert_samples = []
+            start = time.perf_counter()
+            # Same 1000-row transactions the audit log and bulk scoring use
+            for batch_start in range(0, n_new, 1000):
+                batch_timer = time.perf_counter()
+                utils.insert_transactions(conn, rows[batch_start:batch_start + 1000])
+                insert_samples.append(time.perf_counter() - batch_timer)
+            insert_elapsed = time.perf_counter() - start
+            table_size = target_size
+
+            count_samples, first_page_samples, deep_page_samples = [], [], []
+            for user_id in rng.choice(user_ids, sizes['db_query_samples']):
+                user_id = int(user_id)
+                start = time.perf_counter()
+                utils.count_transactions(conn, user_id)
+                count_samples.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                page = utils.fetch_transactions_page(conn, user_id, 50)
+                first_page_samples.append(time.perf_counter() - start)
+
+                # Walk five pages in to measure keyset continuation rather than the first range scan
+                for _ in range(5):
+                    if len(page) < 50:
+                        break
+                    before = (page[-1]['Timestamp'], page[-1]['id'])
+                    start = time.perf_counter()
+                    page = utils.fetch_transactions_page(conn, user_id, 50, before=before)
+                    deep_page_samples.append(time.perf_counter() - start)
+
+            results[str(target_size)] = {
+                'insert_rows_per_s': round(n_new / insert_elapsed, 1),
+                'insert_batch_1000': latency_summary(insert_samples),
+                'count_query': latency_summary(count_samples),
+                'first_page_query': latency_summary(first_page_samples),
+                'next_page_query': latency_summary(deep_page_samples) if deep_page_samples else None,
+                'db_size_mb': round(os.path.getsize(utils.DB_FILE) / 1e6, 2),
+            }
+        conn.close()
+    finally:
+        utils.get_connection_pool().close_all()
+        utils.DB_FILE = original_db_file
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+# --- EDA ---
+def bench_eda(sizes, seed):
+    tmp_dir = tempfile.mkdtemp(prefix='fraud_bench_eda_')
+    try:
+        csv_path = synthetic_data.write_transactions_csv(os.path.join(tmp_dir, 'card_fraud.csv'),
+                                                         sizes['eda_rows'], seed=seed)
+        start = time.perf_counter()
+        eda_stats.load_eda_summary(csv_path, rebuild=True)
+        cold_elapsed = time.perf_counter() - start
+
+        warm_samples = []
+        for _ in range(20):
+            start = time.perf_counter()
+            eda_stats.load_eda_summary(csv_path)
+            warm_samples.append(time.perf_counter() - start)
+        return {
+            'rows': sizes['eda_rows'],
+            'csv_size_mb': round(os.path.getsize(csv_path) / 1e6, 2),
+            'cold_build_ms': round(cold_elapsed * 1000.0, 1),
+            'warm_load': latency_summary(warm_samples),
+        }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# --- Cold Start ---
+COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import inference
+imported = time.perf_counter()
+inference.get_model()
+inference.get_scaler()
+loaded = time.perf_counter()
+inference.predict_transaction(json.loads(RECORD))
+scored = time.perf_counter()
+print(json.dumps({'import': imported - start, 'load': loaded - imported, 'first_prediction': scored - loaded}))
+"""
+
+def bench_cold_start(sizes, seed):
+    record = synthetic_data.raw_input_records(synthetic_data.generate_transactions(1, seed=seed))[0]
+    script = COLD_START_SCRIPT.replace('RECORD', repr(json.dumps(record)))
+    runs = []
+    for _ in range(sizes['cold_start_runs']):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        total = time.perf_counter() - start
+        runs.append({**json.loads(output.stdout.strip().splitlines()[-1]), 'process': total})
+    # Medians: the first run also pays for a cold OS page cache
+    return {
+        f'{stage}_ms': round(float(np.median([run[stage] for run in runs])) * 1000.0, 1)
+        for stage in ('import', 'load', 'first_prediction', 'process')
+    }
+
+BENCHMARKS = {
+    'scoring': bench_scoring,
+    'database': bench_database,
+    'eda': bench_eda,
+    'cold_start': bench_cold_start,
+}
+
+def run_benchmarks(suites=BENCHMARK_SUITES, quick=False, seed=0):
+    sizes = QUICK_SIZES if quick else FULL_SIZES
+    results = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': quick,
+            'seed': seed,
+            'sizes': sizes,
+        },
+        'results': {},
+    }
+    for suite in suites:
+        print(f"Running {suite} benchmarks...", file=sys.stderr)
+        start = time.perf_counter()
+        results['results'][suite] = BENCHMARKS[suite](sizes, seed)
+        print(f"  done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return results
+
+# --- Baseline Comparison ---
+def _flatten_metrics(results, prefix=''):
+    metrics = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            metrics.update(_flatten_metrics(value, name))
+        elif isinstance(value, (int, float)) and (key.endswith('_ms') or key.endswith('_per_s')):
+            metrics[name] = value
+    return metrics
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE, tail_tolerance=TAIL_REGRESSION_TOLERANCE):
+    """Return a list of (metric, baseline, current, relative change) for regressed metrics."""
+    current = _flatten_metrics(results['results'])
+    previous = _flatten_metrics(baseline['results'])
+    regressions = []
+    for name, baseline_value in previous.items():
+        key = name.rsplit('.', 1)[-1]
+        if name not in current or not baseline_value or key in UNCOMPARED_METRICS:
+            continue
+        allowed = tail_tolerance if key in TAIL_METRICS else tolerance
+        change = (current[name] - baseline_value) / baseline_value
+        # A latency that went up, or a throughput that went down, beyond the tolerance
+        regressed = change > allowed if name.endswith('_ms') else change < -allowed
+        if regressed:
+            regressions.append((name, baseline_value, current[name], change))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the fraud detection performance benchmarks")
+    parser.add_argument('--suite', action='append', choices=BENCHMARK_SUITES,
+                        help="Suite to run (repeatable); default: all")
+    parser.add_argument('--quick', action='store_true', help="Small sizes for a fast smoke run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=BENCHMARK_RESULTS_PATH)
+    parser.add_argument('--baseline', help="Previous results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="Allowed relative regression per metric (default: %(default)s)")
+    parser.add_argument('--tail-tolerance', type=float, default=TAIL_REGRESSION_TOLERANCE,
+                        help="Allowed relative regression for p99 latencies (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.suite or BENCHMARK_SUITES, quick=args.quick, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.tail_tolerance)
+        for name, baseline_value, current_value, change in regressions:
+            print(f"REGRESSION {name}: {baseline_value} -> {current_value} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} (p99: {args.tail_tolerance:.0%}) against {args.baseline}")
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from fingerprints import file_fingerprint
+
+# --- Two-Stage Cascade Scorer ---
+# A logistic-regression pre-filter over final_model_features settles the clear cases and only
+# the uncertain band is sent to the random forest:
+#   stage-1 probability <  low_threshold   -> Legit, forest skipped
+#   stage-1 probability >= high_threshold  -> Fraud, forest skipped
+#   otherwise                              -> forest decides
+# Both thresholds are calibrated offline on a held-out split of card_fraud.csv. low_threshold
+# is the largest value at which the cascade still reaches the target fraud recall; high_threshold
+# is the smallest value at which the stage-1 fraud band is at least as precise as the forest
+# (or disabled when none is). Thresholds stay on their side of 0.5, so the stage-1 probability
+# always agrees with the label it settles.
+# The stage-1 model is trained with class_weight='balanced', so its raw probability overstates
+# fraud. Settled rows are reported on the forest's scale instead: an isotonic map from stage-1
+# probability to the forest's fraud probability, fitted on the calibration split and clipped to
+# the side of 0.5 the row was settled on.
+
+CASCADE_PATH = './cascade_model.joblib'
+CASCADE_RECALL_RETAINED = 0.995      # default target: 99.5% of the forest's own recall
+CASCADE_CALIBRATION_SPLIT = 0.3
+CASCADE_THRESHOLD_CANDIDATES = 2000
+
+class CascadeScorer:
+    def __init__(self, coef, intercept, low_threshold, high_threshold, report=None, calibration=None):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        # (stage-1 knots, forest-probability knots); None for artifacts trained before it existed
+        self.calibration = calibration
+        self.report = report or {}
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.settled_legit = 0
+        self.settled_fraud = 0
+
+    def stage1_proba(self, features):
+        # One dot product per row: the whole cost of the first stage
+        return 1.0 / (1.0 + np.exp(-(features @ self.coef + self.intercept)))
+
+    def settled_fraud_proba(self, stage1):
+        # Forest-scale fraud probability for settled rows, kept on the side of 0.5 that argmax
+        # (ties go to Legit) maps to the settled label
+        if self.calibration is None:
+            return stage1
+        knots, values = self.calibration
+        proba = np.interp(stage1, knots, values)
+        fraud = stage1 >= self.high_threshold
+        proba[fraud] = np.maximum(proba[fraud], np.nextafter(0.5, 1.0))
+        proba[~fraud] = np.minimum(proba[~fraud], 0.5)
+        return proba
+
+    def predict_proba(self, features, forest_proba):
+        """Class probabilities (columns [0, 1]); forest_proba(features) is called for the uncertain rows only."""
+        stage1 = self.stage1_proba(features)
+        escalate = (stage1 >= self.low_threshold) & (stage1 < self.high_threshold)
+        settled = self.settled_fraud_proba(stage1)
+        proba = np.column_stack([1.0 - settled, settled])
+        escalated_idx = np.flatnonzero(escalate)
+        if len(escalated_idx):
+            proba[escalated_idx] = forest_proba(features[escalated_idx])
+        n_fraud = int(np.count_nonzero(stage1 >= self.high_threshold))
+        with self._lock:
+            self.rows += len(features)
+            self.settled_fraud += n_fraud
+            self.settled_legit += len(features) - len(escalated_idx) - n_fraud
+        return proba
+
+    def stats(self):
+        with self._lock:
+            settled = self.settled_legit + self.settled_fraud
+            return {
+                'rows': self.rows,
+                'settled_legit': self.settled_legit,
+                'settled_fraud': self.settled_fraud,
+                'escalated': self.rows - settled,
+                'short_circuit_rate': round(settled / self.rows, 4) if self.rows else 0.0,
+                'low_threshold': self.low_threshold,
+                'high_threshold': self.high_threshold,
+            }
+
+# --- Offline Training and Calibration ---
+def _recall_precision(predicted, y):
+    true_positives = int(np.sum(predicted & y))
+    recall = true_positives / max(int(y.sum()), 1)
+    precision = true_positives / max(int(predicted.sum()), 1)
+    return round(recall, 4), round(precision, 4)
+
+def calibrate_thresholds(stage1, forest_fraud, y, target_recall):
+    """Pick (low, high) thresholds on a calibration split; see the module comment."""
+    y = y.astype(bool)
+    forest_fraud = forest_fraud.astype(bool)
+    candidates = np.unique(np.quantile(stage1, np.linspace(0.0, 1.0, CASCADE_THRESHOLD_CANDIDATES)))
+
+    # Recall falls as low_threshold rises, since more frauds are dismissed before the forest
+    n_fraud = max(int(y.sum()), 1)
+    low_threshold = 0.0
+    for threshold in candidates[candidates <= 0.5]:
+        if np.sum(y & forest_fraud & (stage1 >= threshold)) / n_fraud >= target_recall:
+            low_threshold = float(threshold)
+        else:
+            break
+
+    # Settling as Fraud never loses recall; it is allowed only where stage 1 is as precise as the forest
+    _, forest_precision = _recall_precision(forest_fraud, y)
+    high_threshold = float('inf')
+    for threshold in candidates[candidates >= max(0.5, low_threshold)]:
+        band = stage1 >= threshold
+        if band.any() and np.sum(band & y) / band.sum() >= forest_precision:
+            high_threshold = float(threshold)
+            break
+    return low_threshold, high_threshold
+
+def fit_forest_scale(stage1, forest_fraud_proba):
+    # Isotonic (monotone) regression of the forest's fraud probability on the stage-1 probability;
+    # its knots are enough to reproduce it with np.interp at serving time
+    from sklearn.isotonic import IsotonicRegression
+    isotonic = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip')
+    isotonic.fit(stage1, forest_fraud_proba)
+    return isotonic.X_thresholds_.astype(np.float64), isotonic.y_thresholds_.astype(np.float64)
+
+def forest_saw_csv(csv_path):
+    # True when the served model's metadata lists this file among its training sources, False when
+    # it lists others, None when the model has no metadata (the root artifact)
+    from inference import artifact_dir, model_version
+    version = model_version()
+    meta_path = os.path.join(artifact_dir(version), 'metadata.json') if version else None
+    if not meta_path or not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        sources = json.load(f).get('sources', [])
+    fingerprint = file_fingerprint(csv_path)
+    return any(os.path.abspath(source['path']) == os.path.abspath(csv_path)
+               or (source.get('size'), source.get('mtime')) == (fingerprint['size'], fingerprint['mtime'])
+               for source in sources)
+
+def train_cascade(csv_path, target_recall=None, out_path=CASCADE_PATH, seed=42):
+    # Imported here so inference (which imports this module) can load without a cycle, and so
+    # serving a trained cascade (plain coefficients) never pays for importing sklearn's trainers
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from dataset import load_dataset
+    from inference import build_feature_matrix, get_model, final_model_features
+
+    df = load_dataset(csv_path=csv_path)
+    features = build_feature_matrix(df)
+    y = np.asarray(df['isFraud']).astype(bool)
+    X_train, X_cal, y_train, y_cal = train_test_split(
+        features, y, test_size=CASCADE_CALIBRATION_SPLIT, random_state=seed, stratify=y)
+
+    stage1 = LogisticRegression(max_iter=1000, class_weight='balanced')
+    stage1.fit(X_train, y_train)
+
+    model = get_model()
+    start = time.perf_counter()
+    forest_proba = model.predict_proba(pd.DataFrame(X_cal, columns=final_model_features))
+    forest_seconds = time.perf_counter() - start
+    forest_fraud = model.classes_.take(np.argmax(forest_proba, axis=1)) == 1
+    forest_fraud_proba = forest_proba[:, list(model.classes_).index(1)]
+    forest_recall, forest_precision = _recall_precision(forest_fraud, y_cal)
+    if target_recall is None:
+        target_recall = round(forest_recall * CASCADE_RECALL_RETAINED, 4)
+
+    scorer = CascadeScorer(stage1.coef_[0], stage1.intercept_[0], 0.0, float('inf'))
+    start = time.perf_counter()
+    stage1_cal = scorer.stage1_proba(X_cal)
+    stage1_seconds = time.perf_counter() - start
+    low_threshold, high_threshold = calibrate_thresholds(stage1_cal, forest_fraud, y_cal, target_recall)
+    calibration = fit_forest_scale(stage1_cal, forest_fraud_proba)
+    forest_in_sample = forest_saw_csv(csv_path)
+
+    escalated = (stage1_cal >= low_threshold) & (stage1_cal < high_threshold)
+    cascade_fraud = np.where(escalated, forest_fraud, stage1_cal >= high_threshold)
+    cascade_recall, cascade_precision = _recall_precision(cascade_fraud, y_cal)
+    report = {
+        'csv_path': csv_path,
+        'calibration_rows': int(len(y_cal)),
+        'features': final_model_features,
+        'target_recall': target_recall,
+        'low_threshold': low_threshold,
+        'high_threshold': high_threshold if np.isfinite(high_threshold) else None,
+        'short_circuit_rate': round(1.0 - float(escalated.mean()), 4),
+        'forest_recall': forest_recall,
+        'forest_precision': forest_precision,
+        'forest_in_sample': forest_in_sample,
+        'cascade_recall': cascade_recall,
+        'cascade_precision': cascade_precision,
+        'agreement_with_forest': round(float(np.mean(cascade_fraud == forest_fraud)), 4),
+        'forest_ms_per_1k_rows': round(forest_seconds * 1e6 / len(y_cal), 3),
+        'stage1_ms_per_1k_rows': round(stage1_seconds * 1e6 / len(y_cal), 3),
+    }
+    # Expected forest work per row relative to scoring everything with the forest
+    report['estimated_cost_ratio'] = round(
+        (report['stage1_ms_per_1k_rows'] + (1.0 - report['short_circuit_rate']) * report['forest_ms_per_1k_rows'])
+        / report['forest_ms_per_1k_rows'], 4)
+    if forest_in_sample is not False:
+        # The calibration split is held out from stage 1 only; the forest may have been trained on
+        # these rows, which inflates forest_recall/precision and the recall target derived from them
+        report['note'] = ("forest metrics are optimistic: the forest was (or may have been) trained on this CSV. "
+                          "Calibrate on a file the forest never saw for unbiased figures.")
+
+    scorer = CascadeScorer(stage1.coef_[0], stage1.intercept_[0], low_threshold, high_threshold, report, calibration)
+    joblib.dump({
+        'coef': scorer.coef,
+        'intercept': scorer.intercept,
+        'low_threshold': low_threshold,
+        'high_threshold': high_threshold,
+        'report': report,
+        'calibration': calibration,
+    }, out_path)
+    return scorer
+
+def load_cascade(path=CASCADE_PATH):
+    artifact = joblib.load(path)
+    return CascadeScorer(artifact['coef'], artifact['intercept'], artifact['low_threshold'],
+                         artifact['high_threshold'], artifact['report'], artifact.get('calibration'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train and calibrate the cascade pre-filter")
+    parser.add_argument('command', choices=['train', 'report'])
+    parser.add_argument('csv_path', nargs='?', default='./card_fraud.csv')
+    parser.add_argument('--target-recall', type=float,
+                        help=f"Fraud recall to keep (default: {CASCADE_RECALL_RETAINED:.1%} of the forest's recall)")
+    parser.add_argument('--output', default=CASCADE_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        scorer = train_cascade(args.csv_path, args.target_recall, args.output)
+        print(f"Wrote {args.output}")
+    else:
+        scorer = load_cascade(args.output)
+    print(json.dumps({key: value for key, value in scorer.report.items() if key != 'features'}, indent=2))
@@ -0,0 +1,258 @@
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import precision_score, recall_score, roc_auc_score
+
+from forest_engine import FlatForest, load_forest, save_forest
+
+# --- Forest Compaction ---
+# Rewrites the fitted forest into the flat-array format (forest_engine.py) with some accuracy traded
+# for size and speed:
+#   n_trees          keep only the first N trees (random-forest trees are exchangeable)
+#   max_depth        nodes at the cap become leaves predicting their training class distribution
+#   merge_tolerance  an internal node whose two children are leaves with (quantized) fraud
+#                    probabilities within the tolerance becomes a leaf itself, bottom-up
+#   threshold_dtype  float64 (exact), float32 or float16 split thresholds
+#   value_dtype      float64, float16 or uint8 leaf values (uint8 codes are probability * 255)
+# Node indices become int32 and feature ids uint8. The output directory is a regular flat-forest
+# export, so `FRAUD_COMPACT_MODEL=<dir>` makes the app serve it instead of the joblib model.
+#
+# `report` builds a grid of settings and measures, for each and for the original model: size on
+# disk, load time, single-row and batch latency, and ROC-AUC / recall / precision on card_fraud.csv.
+
+COMPACT_FOREST_DIR = './random_forest_compact'
+UINT8_VALUE_SCALE = 1.0 / 255.0
+COMPACT_REPORT_PATH = 'compaction_report.json'
+QUANTIZE_MODES = ['none', 'float16', 'float16-thresholds', 'uint8']
+
+def _quantize_values(values, value_dtype):
+    if value_dtype == 'uint8':
+        return np.round(values / UINT8_VALUE_SCALE).astype(np.uint8), UINT8_VALUE_SCALE
+    return values.astype(value_dtype), 1.0
+
+def _compact_tree(tree, max_depth, merge_tolerance, value_dtype, fraud_col):
+    children_left = tree.children_left
+    children_right = tree.children_right
+    value = tree.value[:, 0, :].astype(np.float64)
+    normalizer = value.sum(axis=1)[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    value = value / normalizer
+    # Merging compares what will actually be stored, so identical codes always merge
+    stored_fraud = _quantize_values(value[:, fraud_col], value_dtype)[0].astype(np.float64)
+
+    feature, threshold, left, right, source = [], [], [], [], []
+
+    def add_leaf(node_id, node):
+        feature[node_id], threshold[node_id] = 0, 0.0
+        left[node_id], right[node_id] = node_id, node_id
+        source[node_id] = node
+
+    def build(node, depth):
+        # Pre-order numbering; returns (new node id, whether it ended up a leaf)
+        node_id = len(feature)
+        feature.append(0)
+        threshold.append(0.0)
+        left.append(node_id)
+        right.append(node_id)
+        source.append(node)
+        if children_left[node] == -1 or (max_depth is not None and depth >= max_depth):
+            add_leaf(node_id, node)
+            return node_id, True
+        left_id, left_is_leaf = build(children_left[node], depth + 1)
+        right_id, right_is_leaf = build(children_right[node], depth + 1)
+        if merge_tolerance is not None and left_is_leaf and right_is_leaf and \
+                abs(stored_fraud[source[left_id]] - stored_fraud[source[right_id]]) <= merge_tolerance:
+            # Both leaf children are the last two nodes written, so dropping them is a truncation
+            del feature[node_id + 1:], threshold[node_id + 1:], left[node_id + 1:], right[node_id + 1:], source[node_id + 1:]
+            add_leaf(node_id, node)
+            return node_id, True
+        feature[node_id] = tree.feature[node]
+        threshold[node_id] = tree.threshold[node]
+        left[node_id], right[node_id] = left_id, right_id
+        return node_id, False
+
+    build(0, 0)
+    return (np.asarray(feature), np.asarray(threshold), np.asarray(left), np.asarray(right),
+            value[np.asarray(source)])
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int64)
+    # Pre-order numbering: parents come before their children
+    for node in range(len(left)):
+        if left[node] != node:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+def compact_forest(model, n_trees=None, max_depth=None, merge_tolerance=None,
+                   threshold_dtype='float64', value_dtype='float64'):
+    fraud_col = list(model.classes_).index(1)
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    forest_depth = 0
+    for estimator in model.estimators_[:n_trees]:
+        feature, threshold, left, right, value = _compact_tree(
+            estimator.tree_, max_depth, merge_tolerance, value_dtype, fraud_col)
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left + offset)
+        rights.append(right + offset)
+        values.append(value)
+        roots.append(offset)
+        offset += len(feature)
+        forest_depth = max(forest_depth, _tree_depth(left, right))
+
+    index_dtype = np.int32 if offset < 2 ** 31 else np.int64
+    value, value_scale = _quantize_values(np.concatenate(values), value_dtype)
+    return FlatForest(
+        feature=np.concatenate(features).astype(np.uint8 if model.n_features_in_ <= 256 else np.int32),
+        threshold=np.concatenate(thresholds).astype(threshold_dtype),
+        left=np.concatenate(lefts).astype(index_dtype),
+        right=np.concatenate(rights).astype(index_dtype),
+        value=np.ascontiguousarray(value),
+        roots=np.asarray(roots, dtype=index_dtype),
+        classes=np.asarray(model.classes_),
+        max_depth=forest_depth,
+        value_scale=value_scale,
+    )
+
+# --- Report ---
+def setting_label(setting):
+    parts = [f"trees={setting.get('n_trees') or 'all'}", f"depth={setting.get('max_depth') or 'full'}",
+             f"thresholds={setting.get('threshold_dtype', 'float64')}", f"values={setting.get('value_dtype', 'float64')}"]
+    if setting.get('merge_tolerance') is not None:
+        parts.append(f"merge<={setting['merge_tolerance']:.3g}")
+    return ' '.join(parts)
+
+def _dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def _measure(scorer, X, y, single_rows):
+    fraud_col = list(scorer.classes_).index(1)
+    start = time.perf_counter()
+    proba = np.concatenate([scorer.predict_proba(X[start_row:start_row + 1024])[:, fraud_col]
+                            for start_row in range(0, len(X), 1024)])
+    batch_seconds = time.perf_counter() - start
+    samples = []
+    for row in single_rows:
+        start = time.perf_counter()
+        scorer.predict_proba(row)
+        samples.append(time.perf_counter() - start)
+    predicted = proba > 0.5
+    return {
+        'single_row_p50_ms': round(float(np.percentile(samples, 50)) * 1000.0, 4),
+        'single_row_p99_ms': round(float(np.percentile(samples, 99)) * 1000.0, 4),
+        'batch_rows_per_s': round(len(X) / batch_seconds, 1),
+        'roc_auc': round(float(roc_auc_score(y, proba)), 4),
+        'recall': round(float(recall_score(y, predicted, zero_division=0)), 4),
+        'precision': round(float(precision_score(y, predicted, zero_division=0)), 4),
+    }, proba
+
+def compaction_report(model_path, csv_path, settings, max_rows=20000, seed=0):
+    # Imported here: inference imports forest_engine, and this module may be used without a model
+    from dataset import load_dataset
+    from inference import build_feature_matrix, final_model_features
+
+    df = load_dataset(csv_path=csv_path)
+    if max_rows and len(df) > max_rows:
+        df = df.sample(max_rows, random_state=seed)
+    X = pd.DataFrame(build_feature_matrix(df), columns=final_model_features)
+    y = np.asarray(df['isFraud']).astype(bool)
+    single_rows = [X.iloc[[idx]] for idx in range(min(300, len(X)))]
+
+    start = time.perf_counter()
+    model = joblib.load(model_path)
+    load_ms = (time.perf_counter() - start) * 1000.0
+    model.n_jobs = None  # single-threaded, like the flat engine
+    baseline, baseline_proba = _measure(model, X, y, single_rows)
+    rows = [{'setting': 'original (sklearn joblib)', 'size_mb': round(_dir_size(model_path) / 1e6, 3),
+             'load_ms': round(load_ms, 1), 'trees': len(model.estimators_),
+             'nodes': int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+             **baseline, 'max_abs_proba_diff': 0.0}]
+
+    tmp_dir = tempfile.mkdtemp(prefix='fraud_compact_')
+    try:
+        for setting in settings:
+            out_dir = os.path.join(tmp_dir, str(len(rows)))
+            save_forest(compact_forest(model, **setting), out_dir)
+            start = time.perf_counter()
+            forest = load_forest(out_dir)
+            load_ms = (time.perf_counter() - start) * 1000.0
+            measured, proba = _measure(forest, X, y, single_rows)
+            rows.append({
+                'setting': setting_label(setting), 'params': setting, 'size_mb': round(_dir_size(out_dir) / 1e6, 3), 'load_ms': round(load_ms, 1),
+                'trees': forest.n_estimators, 'nodes': len(forest.feature), **measured,
+                'max_abs_proba_diff': round(float(np.max(np.abs(proba - baseline_proba))), 4),
+            })
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {'model_path': model_path, 'csv_path': csv_path, 'rows_evaluated': int(len(X)), 'results': rows}
+
+def _settings_grid(args, n_model_trees):
+    n_trees = args.n_trees or [None, max(n_model_trees // 2, 1)]
+    max_depth = args.max_depth or [None, 8]
+    quantize = args.quantize or QUANTIZE_MODES
+    grid = []
+    for trees, depth, mode in itertools.product(n_trees, max_depth, quantize):
+        setting = {'n_trees': trees, 'max_depth': depth}
+        if mode == 'float16':
+            setting.update(threshold_dtype='float32', value_dtype='float16', merge_tolerance=0.0)
+        elif mode == 'float16-thresholds':
+            setting.update(threshold_dtype='float16', value_dtype='float16', merge_tolerance=0.0)
+        elif mode == 'uint8':
+            setting.update(threshold_dtype='float32', value_dtype='uint8', merge_tolerance=args.merge_tolerance)
+        grid.append(setting)
+    return grid
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compact the random forest and report the trade-offs")
+    parser.add_argument('command', choices=['build', 'report'])
+    parser.add_argument('--model', default='./random_forest_model.joblib')
+    parser.add_argument('--csv', default='./card_fraud.csv')
+    parser.add_argument('--n-trees', type=int, nargs='*')
+    parser.add_argument('--max-depth', type=int, nargs='*')
+    parser.add_argument('--quantize', nargs='*', choices=QUANTIZE_MODES,
+                        help="none: exact float64; float16: float32 thresholds + float16 values; "
+                             "float16-thresholds: float16 thresholds + float16 values; "
+                             "uint8: float32 thresholds + uint8-coded values")
+    parser.add_argument('--merge-tolerance', type=float, default=2.0 / 255.0,
+                        help="Leaf merge tolerance on the fraud probability for uint8 mode")
+    parser.add_argument('--max-rows', type=int, default=20000, help="Rows of the CSV used by report")
+    parser.add_argument('--output', help=f"build: output directory (default {COMPACT_FOREST_DIR}); "
+                                         f"report: JSON path (default {COMPACT_REPORT_PATH})")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        model = joblib.load(args.model)
+        if any(len(values or []) > 1 for values in (args.n_trees, args.max_depth, args.quantize)):
+            print("build takes a single value per option", file=sys.stderr)
+            sys.exit(2)
+        setting = _settings_grid(args, len(model.estimators_))[0] if (args.n_trees or args.max_depth or args.quantize) \
+            else {'n_trees': None, 'max_depth': None}
+        out_dir = args.output or COMPACT_FOREST_DIR
+        forest = compact_forest(model, **setting)
+        save_forest(forest, out_dir)
+        print(f"Wrote {out_dir}: {forest.n_estimators} trees, {len(forest.feature):,} nodes, "
+              f"max depth {forest.max_depth}, {_dir_size(out_dir) / 1e6:.2f} MB ({setting_label(setting)})")
+    else:
+        model = joblib.load(args.model)
+        report = compaction_report(args.model, args.csv, _settings_grid(args, len(model.estimators_)), args.max_rows)
+        output = args.output or COMPACT_REPORT_PATH
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        columns = ['size_mb', 'load_ms', 'trees', 'nodes', 'single_row_p50_ms', 'batch_rows_per_s',
+                   'roc_auc', 'recall', 'precision', 'max_abs_proba_diff']
+        table = pd.DataFrame([{'setting': row['setting'], **{col: row[col] for col in columns}}
+                              for row in report['results']])
+        print(table.to_string(index=False))
+        print(f"Wrote {output}")
@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+
+from fingerprints import file_fingerprint
+
+# --- Typed, Memory-Mapped Dataset Cache ---
+# card_fraud.csv is parsed once into a columnar binary cache: one .npy file per column plus a
+# schema.json holding dtypes, category dictionaries and the source CSV fingerprint. Strings are
+# stored as small-integer codes, counts as narrow ints. Columns are opened with
+# np.load(mmap_mode='r'), so loading is near-instant, callers only touch the columns they
+# ask for, and several processes share one page-cached copy.
+
+CARD_FRAUD_CSV = './card_fraud.csv'
+CACHE_FORMAT_VERSION = 1
+CONVERT_CHUNK_SIZE = 500000
+
+# Declared schema: storage dtype per column, or 'category' for dictionary-encoded strings.
+# Amounts and distances keep float64 so values round-trip exactly to the CSV.
+CARD_FRAUD_SCHEMA = {
+    'Transaction_ID': 'int32',
+    'User_ID': 'int32',
+    'Transaction_Amount': 'float64',
+    'Transaction_Date': 'category',
+    'Transaction_Time': 'category',
+    'Transaction_Location': 'category',
+    'Merchant_ID': 'int32',
+    'Device_ID': 'int32',
+    'Card_Type': 'category',
+    'Transaction_Currency': 'category',
+    'Transaction_Status': 'category',
+    'Previous_Transaction_Count': 'int16',
+    'Distance_Between_Transactions_km': 'float64',
+    'Time_Since_Last_Transaction_min': 'int16',
+    'Authentication_Method': 'category',
+    'Transaction_Velocity': 'int16',
+    'Transaction_Category': 'category',
+    'isFraud': 'int8',
+}
+
+def cache_dir_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.cache'
+
+def _code_dtype(n_categories):
+    return np.int8 if n_categories <= 127 else np.int16 if n_categories <= 32767 else np.int32
+
+def _checked_cast(values, dtype, col):
+    # Refuse lossy narrowing instead of silently wrapping or truncating
+    target = np.dtype(dtype)
+    values = np.asarray(values)
+    if target.kind in 'iu':
+        if pd.isna(values).any():
+            raise ValueError(f"Column {col} has missing values and cannot be stored as {dtype}")
+        info = np.iinfo(target)
+        if len(values) and (values.min() < info.min or values.max() > info.max or (values != np.round(values)).any()):
+            raise ValueError(f"Column {col} does not fit in {dtype}")
+    return values.astype(target)
+
+def _count_rows(csv_path):
+    with open(csv_path, 'rb') as f:
+        lines = sum(block.count(b'\n') for block in iter(lambda: f.read(8 * 1024 * 1024), b''))
+        f.seek(-1, os.SEEK_END)
+        ends_with_newline = f.read(1) == b'\n'
+    return lines - 1 + (0 if ends_with_newline else 1)
+
+def build_cache(csv_path=CARD_FRAUD_CSV, cache_dir=None, schema=CARD_FRAUD_SCHEMA, chunk_size=CONVERT_CHUNK_SIZE):
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    tmp_dir = cache_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    n_rows = _count_rows(csv_path)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    columns = [col for col in header if col in schema]
+    read_dtypes = {col: str if schema[col] == 'category' else None for col in columns}
+    read_dtypes = {col: dtype for col, dtype in read_dtypes.items() if dtype is not None}
+
+    dictionaries = {col: {} for col in columns if schema[col] == 'category'}
+    # Category codes are written as int32 first and narrowed once the dictionary size is known
+    arrays = {
+        col: np.lib.format.open_memmap(os.path.join(tmp_dir, f'{col}.npy'), mode='w+', shape=(n_rows,),
+                                       dtype=np.int32 if schema[col] == 'category' else schema[col])
+        for col in columns
+    }
+
+    offset = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, usecols=columns, dtype=read_dtypes):
+        end = offset + len(chunk)
+        for col in columns:
+            if schema[col] == 'category':
+                dictionary = dictionaries[col]
+                values = chunk[col]
+                for value in values.dropna().unique():
+                    dictionary.setdefault(value, len(dictionary))
+                # Missing values get code -1, which Categorical.from_codes reads back as NaN
+                arrays[col][offset:end] = values.map(dictionary).fillna(-1).to_numpy(dtype=np.int32)
+            else:
+                arrays[col][offset:end] = _checked_cast(chunk[col].to_numpy(), schema[col], col)
+        offset = end
+    if offset != n_rows:
+        raise ValueError(f"Row count mismatch while converting {csv_path}: expected {n_rows}, read {offset}")
+
+    column_meta = {}
+    for col in columns:
+        array = arrays.pop(col)
+        array.flush()
+        del array
+        if schema[col] == 'category':
+            categories = list(dictionaries[col])
+            path = os.path.join(tmp_dir, f'{col}.npy')
+            codes = np.load(path, mmap_mode='r').astype(_code_dtype(len(categories)))
+            np.save(path, codes)
+            column_meta[col] = {'dtype': str(codes.dtype), 'categories': categories}
+        else:
+            column_meta[col] = {'dtype': schema[col]}
+
+    meta = {
+        'version': CACHE_FORMAT_VERSION,
+        'n_rows': n_rows,
+        'columns': column_meta,
+        'source': file_fingerprint(csv_path),
+    }
+    with open(os.path.join(tmp_dir, 'schema.json'), 'w') as f:
+        json.dump(meta, f, separators=(',', ':'))
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    return meta
+
+def _load_meta(csv_path, cache_dir):
+    meta_path = os.path.join(cache_dir, 'schema.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') == CACHE_FORMAT_VERSION and meta['source'] == file_fingerprint(csv_path):
+            return meta
+    return build_cache(csv_path, cache_dir)
+
+def load_columns(columns=None, csv_path=CARD_FRAUD_CSV, cache_dir=None):
+    """Return ({column: read-only memmapped array}, {column: categories}) for the requested columns.
+
+    Category columns come back as integer codes; their dictionaries are in the second mapping.
+    The cache is (re)built from the CSV when missing or stale.
+    """
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    meta = _load_meta(csv_path, cache_dir)
+    columns = columns or list(meta['columns'])
+    missing = [col for col in columns if col not in meta['columns']]
+    if missing:
+        raise KeyError(f"Columns not in dataset cache: {', '.join(missing)}")
+    arrays = {col: np.load(os.path.join(cache_dir, f'{col}.npy'), mmap_mode='r') for col in columns}
+    categories = {col: meta['columns'][col]['categories'] for col in columns if 'categories' in meta['columns'][col]}
+    return arrays, categories
+
+def load_dataset(columns=None, csv_path=CARD_FRAUD_CSV, cache_dir=None):
+    # DataFrame view of the cache; category columns become pandas Categoricals over the codes
+    arrays, categories = load_columns(columns, csv_path, cache_dir)
+    data = {}
+    for col, array in arrays.items():
+        if col in categories:
+            data[col] = pd.Categorical.from_codes(array, categories=categories[col])
+        else:
+            data[col] = array
+    return pd.DataFrame(data, copy=False)
+
+if __name__ == '__main__':
+    # Usage: python dataset.py [card_fraud.csv]  -- (re)build the binary cache
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else CARD_FRAUD_CSV
+    meta = build_cache(csv_path)
+    print(f"Cached {meta['n_rows']} rows x {len(meta['columns'])} columns in {cache_dir_for(csv_path)}")
@@ -0,0 +1,214 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from fingerprints import file_fingerprint, file_sha256
+
+# --- Precomputed EDA Statistics ---
+# The EDA page renders from a compact JSON summary instead of the raw dataset. The summary is
+# computed in two chunked passes over the CSV (so any file size fits in memory) and stored in a
+# sidecar file next to it, keyed by the CSV's size, mtime and SHA-256. Page load time then
+# depends only on the summary size, not on the number of rows.
+
+EDA_CSV_PATH = './card_fraud.csv'
+EDA_SUMMARY_VERSION = 1
+EDA_CHUNK_SIZE = 200000
+EDA_QUANTILE_BINS = 4096       # fine histogram used for quantiles and box plots
+EDA_DISPLAY_BINS = 50
+EDA_MAX_TRACKED_UNIQUES = 100000
+
+target_col = 'isFraud'
+
+eda_numerical_cols = [
+    'Transaction_Amount',
+    'Previous_Transaction_Count',
+    'Distance_Between_Transactions_km',
+    'Time_Since_Last_Transaction_min',
+    'Transaction_Velocity'
+]
+
+eda_categorical_cols = [
+    'Transaction_Location',
+    'Card_Type',
+    'Transaction_Currency',
+    'Transaction_Status',
+    'Authentication_Method',
+    'Transaction_Category'
+]
+
+def summary_path(csv_path):
+    return csv_path + '.eda.json'
+
+def _quantiles_from_histogram(counts, edges, quantiles):
+    # Linear interpolation inside the fine bin that contains each quantile
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    results = []
+    for q in quantiles:
+        target = q * total
+        idx = int(np.searchsorted(cumulative, target, side='left'))
+        idx = min(idx, len(counts) - 1)
+        below = cumulative[idx - 1] if idx > 0 else 0
+        fraction = (target - below) / counts[idx] if counts[idx] else 0.0
+        results.append(float(edges[idx] + fraction * (edges[idx + 1] - edges[idx])))
+    return results
+
+def _box_stats(counts, edges, q1, median, q3):
+    # Whiskers follow seaborn/matplotlib: the most extreme data within 1.5 IQR of the box
+    iqr = q3 - q1
+    occupied = np.flatnonzero(counts)
+    lows = edges[:-1][occupied]
+    highs = edges[1:][occupied]
+    inside = (lows >= q1 - 1.5 * iqr) & (highs <= q3 + 1.5 * iqr)
+    whislo = float(lows[inside].min()) if inside.any() else q1
+    whishi = float(highs[inside].max()) if inside.any() else q3
+    outliers = int(counts[occupied][~inside].sum())
+    return {'whislo': whislo, 'q1': q1, 'med': median, 'q3': q3, 'whishi': whishi, 'outliers': outliers}
+
+def compute_eda_summary(csv_path, chunk_size=EDA_CHUNK_SIZE):
+    # --- Pass 1: column info, moments, ranges and categorical value counts ---
+    n_rows = 0
+    columns = {}
+    moments = {}
+    value_counts = {col: {} for col in eda_categorical_cols + [target_col]}
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        n_rows += len(chunk)
+        for col in chunk.columns:
+            series = chunk[col]
+            info = columns.setdefault(col, {'dtype': str(series.dtype), 'non_null': 0, 'uniques': set(), 'unique_overflow': False})
+            info['non_null'] += int(series.count())
+            if not info['unique_overflow']:
+                info['uniques'].update(series.dropna().unique().tolist())
+                if len(info['uniques']) > EDA_MAX_TRACKED_UNIQUES:
+                    info['unique_overflow'] = True
+                    info['uniques'] = set()
+
+            if pd.api.types.is_numeric_dtype(series):
+                values = series.dropna().to_numpy(dtype=np.float64)
+                if len(values) == 0:
+                    continue
+                # Chan et al. parallel merge of count/mean/M2
+                n_b, mean_b = len(values), values.mean()
+                m2_b = ((values - mean_b) ** 2).sum()
+                acc = moments.setdefault(col, {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf})
+                n_a, delta = acc['n'], mean_b - acc['mean']
+                acc['n'] = n_a + n_b
+                acc['mean'] += delta * n_b / acc['n']
+                acc['m2'] += m2_b + delta ** 2 * n_a * n_b / acc['n']
+                acc['min'] = min(acc['min'], values.min())
+                acc['max'] = max(acc['max'], values.max())
+
+        for col in value_counts:
+            if col not in chunk.columns:
+                continue
+            keys = [chunk[col]] + ([chunk[target_col]] if target_col in chunk.columns else [])
+            for key, count in chunk.groupby(keys, dropna=False).size().items():
+                key = key if isinstance(key, tuple) else (key,)
+                value, cls = key[0], (key[1] if len(key) > 1 else None)
+                counts = value_counts[col].setdefault(value, {})
+                counts[str(cls)] = counts.get(str(cls), 0) + int(count)
+
+    # Fine and display bin edges from the observed ranges
+    fine_edges, display_edges = {}, {}
+    for col, acc in moments.items():
+        low, high = acc['min'], acc['max']
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        fine_edges[col] = np.linspace(low, high, EDA_QUANTILE_BINS + 1)
+        if col in eda_numerical_cols:
+            display_edges[col] = np.linspace(low, high, EDA_DISPLAY_BINS + 1)
+
+    # --- Pass 2: fine histograms (quantiles/box plots) and per-class display histograms ---
+    fine_counts = {col: np.zeros(EDA_QUANTILE_BINS, dtype=np.int64) for col in fine_edges}
+    display_counts = {col: {} for col in display_edges}
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, usecols=list(fine_edges)):
+        for col, edges in fine_edges.items():
+            values = chunk[col].dropna().to_numpy(dtype=np.float64)
+            fine_counts[col] += np.histogram(values, bins=edges)[0]
+        for col, edges in display_edges.items():
+            classes = chunk[target_col] if target_col in chunk.columns else pd.Series('None', index=chunk.index)
+            for cls, values in chunk[col].groupby(classes):
+                counts = display_counts[col].setdefault(str(cls), np.zeros(EDA_DISPLAY_BINS, dtype=np.int64))
+                counts += np.histogram(values.dropna().to_numpy(dtype=np.float64), bins=edges)[0]
+
+    # --- Assemble the summary ---
+    describe = {}
+    boxplots = {}
+    for col, acc in moments.items():
+        q1, median, q3 = _quantiles_from_histogram(fine_counts[col], fine_edges[col], [0.25, 0.5, 0.75])
+        describe[col] = {
+            'count': float(acc['n']),
+            'mean': float(acc['mean']),
+            'std': float(np.sqrt(acc['m2'] / (acc['n'] - 1))) if acc['n'] > 1 else float('nan'),
+            'min': float(acc['min']),
+            '25%': q1,
+            '50%': median,
+            '75%': q3,
+            'max': float(acc['max']),
+        }
+        if col in eda_numerical_cols:
+            boxplots[col] = _box_stats(fine_counts[col], fine_edges[col], q1, median, q3)
+
+    return {
+        'version': EDA_SUMMARY_VERSION,
+        'n_rows': n_rows,
+        'n_columns': len(columns),
+        'columns': [
+            {
+                'name': col,
+                'dtype': info['dtype'],
+                'non_null': info['non_null'],
+                'nulls': n_rows - info['non_null'],
+                'unique': len(info['uniques']) if not info['unique_overflow'] else EDA_MAX_TRACKED_UNIQUES,
+                'unique_is_lower_bound': info['unique_overflow'],
+            }
+            for col, info in columns.items()
+        ],
+        'describe': describe,
+        'boxplots': boxplots,
+        'histograms': {
+            col: {'edges': display_edges[col].tolist(),
+                  'counts': {cls: counts.tolist() for cls, counts in sorted(display_counts[col].items())}}
+            for col in display_edges
+        },
+        'value_counts': {
+            col: {str(value): counts for value, counts in sorted(col_counts.items(), key=lambda item: str(item[0]))}
+            for col, col_counts in value_counts.items() if col_counts
+        },
+    }
+
+def load_eda_summary(csv_path=EDA_CSV_PATH, rebuild=False):
+    fingerprint = file_fingerprint(csv_path)
+    sidecar = summary_path(csv_path)
+    summary = None
+    if not rebuild and os.path.exists(sidecar):
+        with open(sidecar) as f:
+            summary = json.load(f)
+        if summary.get('version') != EDA_SUMMARY_VERSION:
+            summary = None
+
+    # Cheap check first: same size and mtime means the sidecar is current
+    if summary and summary['fingerprint']['size'] == fingerprint['size'] \
+            and summary['fingerprint']['mtime'] == fingerprint['mtime']:
+        return summary
+
+    # Otherwise only recompute if the content really changed (e.g. not just touched/copied)
+    sha256 = file_sha256(csv_path)
+    if not (summary and summary['fingerprint']['size'] == fingerprint['size']
+            and summary['fingerprint']['sha256'] == sha256):
+        summary = compute_eda_summary(csv_path)
+    summary['fingerprint'] = {**fingerprint, 'sha256': sha256}
+
+    tmp_path = sidecar + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, separators=(',', ':'))
+    os.replace(tmp_path, sidecar)
+    return summary
+
+if __name__ == '__main__':
+    # Usage: python eda_stats.py [card_fraud.csv]  -- precompute the sidecar offline
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else EDA_CSV_PATH
+    summary = load_eda_summary(csv_path, rebuild=True)
+    print(f"Wrote {summary_path(csv_path)} for {summary['n_rows']} rows x {summary['n_columns']} columns")
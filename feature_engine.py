@@ -0,0 +1,282 @@
+import atexit
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from functools import lru_cache
+
+# --- Streaming Velocity / Recency Feature Engine ---
+# Computes the model's behavioural inputs from the event stream instead of asking for them:
+#   Previous_Transaction_Count        events seen for the key before this one
+#   Time_Since_Last_Transaction_min   minutes since the key's previous event
+#   Distance_Between_Transactions_km  great-circle distance from the previous event's location
+#   Transaction_Velocity              events for the key in the last hour, this one included
+# State is one small record per key (card, device or user): a counter, the last event and a
+# ring buffer of recent event minutes for the sliding window. Each update is O(1) amortized.
+# Keys idle for longer than the TTL (in event time) are evicted, and the key count is capped
+# (least recently seen first). State can be snapshotted to and restored from a JSON file.
+# Periodic snapshots are taken by whichever update() finds the interval elapsed; a failed one is
+# logged and never fails that update.
+
+STREAM_FEATURES = [
+    'Previous_Transaction_Count',
+    'Distance_Between_Transactions_km',
+    'Time_Since_Last_Transaction_min',
+    'Transaction_Velocity',
+]
+
+# The first of these present in a record identifies whose stream it belongs to
+FEATURE_KEY_FIELDS = ('Card_ID', 'Device_ID', 'User_ID')
+
+# The app and the scoring service see different streams, so each keeps its own snapshot file
+FEATURE_STATE_PATH = './feature_state.json'
+SERVER_FEATURE_STATE_PATH = './feature_state_server.json'
+FEATURE_STATE_VERSION = 1
+FEATURE_KEY_TTL_MIN = 30 * 24 * 60
+FEATURE_MAX_KEYS = 500000
+VELOCITY_WINDOW_MIN = 60
+VELOCITY_MAX_EVENTS = 256                # ring buffer size; velocity saturates here
+TIME_SINCE_LAST_CAP_MIN = 1440           # also used for a key's first event (training data range)
+FEATURE_SNAPSHOT_INTERVAL_S = 300.0
+
+# Approximate centre (regional capital) of each Transaction_Location value
+REGION_COORDINATES = {
+    'Andijan': (40.78, 72.34),
+    'Bukhara': (39.77, 64.42),
+    'Fergana': (40.39, 71.78),
+    'Jizzakh': (40.12, 67.84),
+    'Kashkadarya': (38.86, 65.79),
+    'Khorezm': (41.55, 60.63),
+    'Namangan': (41.00, 71.67),
+    'Navoiy': (40.10, 65.37),
+    'Samarkand': (39.65, 66.96),
+    'Sirdarya': (40.49, 68.78),
+    'Surkhandarya': (37.22, 67.28),
+    'Tashkent': (41.31, 69.28),
+}
+
+EARTH_RADIUS_KM = 6371.0
+
+logger = logging.getLogger(__name__)
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+@lru_cache(maxsize=4096)
+def _day_minute(date_str):
+    return datetime.strptime(date_str, '%m/%d/%Y').toordinal() * 24 * 60
+
+def event_minute(transaction_date, transaction_time):
+    """Minutes since 0001-01-01 for the MM/DD/YYYY + HH:MM pair used throughout the app."""
+    hours, minutes = str(transaction_time).split(':')[:2]
+    return _day_minute(str(transaction_date)) + int(hours) * 60 + int(minutes)
+
+def feature_key(record):
+    for field in FEATURE_KEY_FIELDS:
+        value = record.get(field)
+        if value is not None and value != '':
+            return f'{field}:{value}'
+    return None
+
+class KeyState:
+    __slots__ = ('last_minute', 'lat', 'lon', 'count', 'window')
+
+    def __init__(self, last_minute, lat, lon, count, window):
+        self.last_minute = last_minute
+        self.lat = lat
+        self.lon = lon
+        self.count = count
+        self.window = window
+
+class StreamingFeatureEngine:
+    def __init__(self, ttl_min=FEATURE_KEY_TTL_MIN, max_keys=FEATURE_MAX_KEYS, velocity_window_min=VELOCITY_WINDOW_MIN):
+        self.ttl_min = ttl_min
+        self.max_keys = max_keys
+        self.velocity_window_min = velocity_window_min
+        self._keys = OrderedDict()   # least recently seen first
+        self._lock = threading.Lock()
+        self.clock = None            # latest event minute seen
+        self.events = 0
+        self.evicted = 0
+        self.snapshot_path = None
+        self._next_snapshot = None
+        self._schedule_lock = threading.Lock()   # guards _next_snapshot
+        self._snapshot_lock = threading.Lock()   # one snapshot written at a time, in capture order
+
+    def update(self, key, minute, location):
+        """Record one event and return its stream features (values as of just before the event).
+
+        `location` is a Transaction_Location name or a (lat, lon) pair; unknown names add no distance.
+        """
+        lat, lon = REGION_COORDINATES.get(location, (None, None)) if isinstance(location, str) else location
+        with self._lock:
+            self.events += 1
+            if self.clock is None or minute > self.clock:
+                self.clock = minute
+            state = self._keys.get(key)
+            if state is None:
+                state = KeyState(minute, lat, lon, 0, deque(maxlen=VELOCITY_MAX_EVENTS))
+                self._keys[key] = state
+                time_since_last = TIME_SINCE_LAST_CAP_MIN
+                distance = 0.0
+            else:
+                self._keys.move_to_end(key)
+                # A late (out-of-order) event counts as simultaneous with the latest one
+                minute = max(minute, state.last_minute)
+                time_since_last = min(minute - state.last_minute, TIME_SINCE_LAST_CAP_MIN)
+                distance = 0.0
+                if lat is not None and state.lat is not None:
+                    distance = haversine_km(state.lat, state.lon, lat, lon)
+                state.last_minute = minute
+                if lat is not None:
+                    state.lat, state.lon = lat, lon
+
+            window = state.window
+            window.append(minute)
+            while window[0] <= minute - self.velocity_window_min:
+                window.popleft()
+            features = {
+                'Previous_Transaction_Count': state.count,
+                'Distance_Between_Transactions_km': round(distance, 2),
+                'Time_Since_Last_Transaction_min': time_since_last,
+                'Transaction_Velocity': len(window),
+            }
+            state.count += 1
+            self._evict()
+        self._maybe_snapshot()
+        return features
+
+    def _evict(self):
+        # Called with the lock held. Oldest keys sit at the front, so this stops at the first live one.
+        expire_before = self.clock - self.ttl_min
+        while self._keys:
+            oldest_key, oldest = next(iter(self._keys.items()))
+            if oldest.last_minute >= expire_before and len(self._keys) <= self.max_keys:
+                break
+            del self._keys[oldest_key]
+            self.evicted += 1
+
+    def update_record(self, record):
+        # Convenience for raw transaction dicts; returns None when the record has no key
+        key = feature_key(record)
+        if key is None:
+            return None
+        minute = event_minute(record['Transaction_Date'], record['Transaction_Time'])
+        if record.get('Latitude') is not None and record.get('Longitude') is not None:
+            location = (float(record['Latitude']), float(record['Longitude']))
+        else:
+            location = record.get('Transaction_Location')
+        return self.update(key, minute, location)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._keys),
+                'max_keys': self.max_keys,
+                'events': self.events,
+                'evicted': self.evicted,
+                'clock_minute': self.clock,
+            }
+
+    # --- Snapshot / Restore ---
+    def snapshot(self, path=None):
+        path = path or self.snapshot_path or FEATURE_STATE_PATH
+        with self._snapshot_lock:
+            with self._lock:
+                state = {
+                    'version': FEATURE_STATE_VERSION,
+                    'clock': self.clock,
+                    'events': self.events,
+                    'evicted': self.evicted,
+                    'keys': [[key, s.last_minute, s.lat, s.lon, s.count, list(s.window)] for key, s in self._keys.items()],
+                }
+            # A temp file of its own in the target directory, so os.replace stays atomic
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.',
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(state, f, separators=(',', ':'))
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return len(state['keys'])
+
+    def restore(self, path=None):
+        path = path or self.snapshot_path or FEATURE_STATE_PATH
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('version') != FEATURE_STATE_VERSION:
+            raise ValueError(f"Unsupported feature state version in {path}: {state.get('version')}")
+        with self._lock:
+            self._keys = OrderedDict(
+                (key, KeyState(last_minute, lat, lon, count, deque(window, maxlen=VELOCITY_MAX_EVENTS)))
+                for key, last_minute, lat, lon, count, window in state['keys']
+            )
+            self.clock = state['clock']
+            self.events = state['events']
+            self.evicted = state['evicted']
+        return len(self._keys)
+
+    def enable_autosnapshot(self, path=FEATURE_STATE_PATH, interval_s=FEATURE_SNAPSHOT_INTERVAL_S):
+        self.snapshot_path = path
+        self._snapshot_interval = interval_s
+        self._next_snapshot = time.monotonic() + interval_s
+
+    def _maybe_snapshot(self):
+        # Only the caller that moves the deadline takes the snapshot
+        with self._schedule_lock:
+            if self._next_snapshot is None or time.monotonic() < self._next_snapshot:
+                return
+            self._next_snapshot = time.monotonic() + self._snapshot_interval
+        self.autosnapshot()
+
+    def autosnapshot(self):
+        # snapshot() for background use (periodic and at exit): errors are logged, not raised
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Feature state snapshot to %s failed", self.snapshot_path)
+
+def enrich_records(records, engine=None):
+    """Feed each keyed record through the engine, filling in stream features the record lacks.
+
+    Every keyed record updates the state, so the stream stays complete; values the caller
+    supplied explicitly are kept. Records without a key are returned unchanged.
+    """
+    engine = engine or get_feature_engine()
+    enriched = []
+    for record in records:
+        features = engine.update_record(record)
+        if features:
+            record = dict(record)
+            for name, value in features.items():
+                if record.get(name) is None:
+                    record[name] = value
+        enriched.append(record)
+    return enriched
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_feature_engine(state_path=FEATURE_STATE_PATH):
+    # Process-wide engine, restored from the last snapshot and saved periodically and at exit
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = StreamingFeatureEngine()
+            if os.path.exists(state_path):
+                _engine.restore(state_path)
+            _engine.enable_autosnapshot(state_path)
+            atexit.register(_engine.autosnapshot)
+        elif _engine.snapshot_path != state_path:
+            raise ValueError(f"Feature engine already uses {_engine.snapshot_path}, not {state_path}")
+        return _engine
@@ -0,0 +1,18 @@
+import hashlib
+import os
+
+# --- File Fingerprints ---
+# Cheap identity of an input file, shared by the caches (dataset.py, eda_stats.py), the training
+# metadata and the backtest checkpoints. Kept dependency-free so any of them can import it.
+
+def file_fingerprint(path):
+    # Size and modification time: changes whenever the file is rewritten
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def file_sha256(path, block_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
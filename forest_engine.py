@@ -0,0 +1,185 @@
+import os
+import sys
+import numpy as np
+import joblib
+
+# --- Flat-Array Random Forest Inference Engine ---
+# The fitted forest is exported once into contiguous NumPy arrays (one entry per node,
+# all trees concatenated) and evaluated for a whole batch with level-by-level traversal:
+# every (row, tree) pair advances one level per step through pure array gathers,
+# instead of sklearn's per-estimator Python loop.
+
+FLAT_FOREST_DIR = './random_forest_flat'
+FLAT_FOREST_ARRAYS = ['feature', 'threshold', 'left', 'right', 'value', 'roots', 'classes']
+
+def export_forest(model, out_dir=FLAT_FOREST_DIR):
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(n_nodes)
+
+        # Leaves point back at themselves, so extra traversal steps past a leaf are no-ops
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+        feature = np.where(is_leaf, 0, tree.feature)
+
+        # Same per-tree normalisation as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+
+        features.append(feature)
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(value / normalizer)
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    forest = FlatForest(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.int64),
+        right=np.concatenate(rights).astype(np.int64),
+        value=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.asarray(roots, dtype=np.int64),
+        classes=np.asarray(model.classes_),
+        max_depth=max_depth,
+    )
+    save_forest(forest, out_dir)
+    return forest
+
+def save_forest(forest, out_dir=FLAT_FOREST_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    for name in FLAT_FOREST_ARRAYS:
+        np.save(os.path.join(out_dir, f'{name}.npy'), getattr(forest, 'classes_' if name == 'classes' else name))
+    np.save(os.path.join(out_dir, 'max_depth.npy'), np.asarray(forest.max_depth, dtype=np.int64))
+    # Integer-coded leaf values (see compact_forest.py) are stored with their scale
+    scale_path = os.path.join(out_dir, 'value_scale.npy')
+    if forest.value_scale != 1.0:
+        np.save(scale_path, np.asarray(forest.value_scale, dtype=np.float64))
+    elif os.path.exists(scale_path):
+        os.remove(scale_path)
+
+def forest_files(out_dir=FLAT_FOREST_DIR):
+    # Every file save_forest may write, e.g. for watching an export for rebuilds
+    names = list(FLAT_FOREST_ARRAYS) + ['max_depth', 'value_scale']
+    return [os.path.join(out_dir, f'{name}.npy') for name in names]
+
+def load_forest(out_dir=FLAT_FOREST_DIR, mmap_mode=None):
+    # np.asarray drops the np.memmap subclass (still backed by the mapping): indexing a memmap
+    # goes through a Python-level __getitem__, which dominates single-row traversal
+    arrays = {name: np.asarray(np.load(os.path.join(out_dir, f'{name}.npy'), mmap_mode=mmap_mode))
+              for name in FLAT_FOREST_ARRAYS}
+    max_depth = int(np.load(os.path.join(out_dir, 'max_depth.npy')))
+    scale_path = os.path.join(out_dir, 'value_scale.npy')
+    value_scale = float(np.load(scale_path)) if os.path.exists(scale_path) else 1.0
+    return FlatForest(max_depth=max_depth, value_scale=value_scale, **arrays)
+
+class FlatForest:
+    """Drop-in replacement for RandomForestClassifier.predict_proba/predict over exported arrays.
+
+    Arrays may use narrower dtypes (compact_forest.py); leaf values stored as integer codes
+    are multiplied by value_scale after averaging.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes, max_depth, value_scale=1.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = max_depth
+        self.value_scale = value_scale
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        # sklearn trees compare float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+
+        # One slot per (row, tree) pair; row_offset points at the row's first feature in X_flat
+        nodes = np.tile(self.roots.astype(np.int64), n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, len(self.roots))
+
+        # Only pairs that have not reached a leaf are advanced at each level
+        active = np.flatnonzero(self.left[nodes] != nodes)
+        for _ in range(self.max_depth):
+            if len(active) == 0:
+                break
+            current = nodes[active]
+            go_left = X_flat[row_offset[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[self.left[current] != current]
+        return nodes.reshape(n_rows, len(self.roots))
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        # Accumulate tree by tree in estimator order, exactly like the forest's averaging
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for tree_idx in range(leaves.shape[1]):
+            proba += self.value[leaves[:, tree_idx]]
+        proba /= leaves.shape[1]
+        if self.value_scale != 1.0:
+            proba *= self.value_scale
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+# --- Parity Check ---
+def verify_parity(model, forest, X):
+    # Single-threaded sklearn sums tree probabilities in estimator order, like FlatForest
+    n_jobs = model.n_jobs
+    model.n_jobs = None
+    try:
+        expected = model.predict_proba(X)
+    finally:
+        model.n_jobs = n_jobs
+    actual = forest.predict_proba(X)
+    mismatches = int(np.sum(np.any(expected != actual, axis=1)))
+    return mismatches, float(np.max(np.abs(expected - actual))) if len(actual) else 0.0
+
+if __name__ == '__main__':
+    # Usage: python forest_engine.py export [model.joblib] [out_dir]
+    #        python forest_engine.py verify [card_fraud.csv] [out_dir]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    if command == 'export':
+        model_path = sys.argv[2] if len(sys.argv) > 2 else './random_forest_model.joblib'
+        out_dir = sys.argv[3] if len(sys.argv) > 3 else FLAT_FOREST_DIR
+        forest = export_forest(joblib.load(model_path), out_dir)
+        print(f"Exported {forest.n_estimators} trees ({len(forest.feature)} nodes, max depth {forest.max_depth}) to {out_dir}")
+    elif command == 'verify':
+        import pandas as pd
+        from inference import build_feature_matrix, final_model_features, model_path
+        # The sklearn model itself: get_model() may be serving a compacted FlatForest
+        model = joblib.load(model_path())
+        csv_path = sys.argv[2] if len(sys.argv) > 2 else './card_fraud.csv'
+        out_dir = sys.argv[3] if len(sys.argv) > 3 else FLAT_FOREST_DIR
+        forest = load_forest(out_dir)
+        total_rows = 0
+        total_mismatches = 0
+        for chunk in pd.read_csv(csv_path, chunksize=50000, dtype={'Transaction_Date': str, 'Transaction_Time': str}):
+            X = pd.DataFrame(build_feature_matrix(chunk), columns=final_model_features)
+            mismatches, max_diff = verify_parity(model, forest, X)
+            total_rows += len(chunk)
+            total_mismatches += mismatches
+            if mismatches:
+                print(f"Chunk ending at row {total_rows}: {mismatches} mismatching rows (max abs diff {max_diff:.3e})")
+        print(f"Verified {total_rows} rows: {total_mismatches} probability mismatches")
+        sys.exit(1 if total_mismatches else 0)
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(2)
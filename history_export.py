@@ -0,0 +1,94 @@
+import csv
+import os
+import tempfile
+import time
+
+from utils import get_db_connection, fetch_transactions_page, HISTORY_SELECT_COLUMNS
+
+# --- Streaming History Export ---
+# Rows are read from SQLite in keyset-paginated chunks and written straight to a temp file,
+# as CSV or through openpyxl's write-only (streaming) workbook. Neither the full history
+# nor the finished file is ever held as a DataFrame/BytesIO in the Streamlit process.
+# Export files live in their own temp directory. The page removes one once it has been downloaded,
+# and preparing any export removes files older than EXPORT_MAX_AGE_S, so exports from sessions
+# that ended without a download do not accumulate.
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'fraud_history_exports')
+EXPORT_MAX_AGE_S = 3600
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'text/csv'),
+    'Excel': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+export_header = [column.split(' AS ')[-1] for column in HISTORY_SELECT_COLUMNS]
+
+def iter_history_rows(conn, user_id, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    # Yields lists of row tuples (without the internal id), newest first
+    before = None
+    while True:
+        chunk = fetch_transactions_page(conn, user_id, chunk_size, before=before, **filters)
+        if not chunk:
+            return
+        yield [tuple(record)[1:] for record in chunk]
+        before = (chunk[-1]['Timestamp'], chunk[-1]['id'])
+
+def write_history_csv(path, chunks):
+    row_count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(export_header)
+        for rows in chunks:
+            writer.writerows(rows)
+            row_count += len(rows)
+    return row_count
+
+def write_history_xlsx(path, chunks):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Transaction History')
+    sheet.append(export_header)
+    row_count = 0
+    for rows in chunks:
+        for row in rows:
+            sheet.append(row)
+        row_count += len(rows)
+    workbook.save(path)
+    return row_count
+
+def create_history_export(user_id, export_format='CSV', chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    # Returns (temp file path, row count); the caller removes the file when done with it
+    suffix, _ = EXPORT_FORMATS[export_format]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    remove_stale_exports()
+    fd, path = tempfile.mkstemp(prefix='transaction_history_', suffix=suffix, dir=EXPORT_DIR)
+    os.close(fd)
+    conn = None
+    try:
+        conn = get_db_connection()
+        chunks = iter_history_rows(conn, user_id, chunk_size, **filters)
+        if export_format == 'Excel':
+            row_count = write_history_xlsx(path, chunks)
+        else:
+            row_count = write_history_csv(path, chunks)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        if conn:
+            conn.close()
+    return path, row_count
+
+def remove_export(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def remove_stale_exports(max_age_s=EXPORT_MAX_AGE_S):
+    cutoff = time.time() - max_age_s
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.name.startswith('transaction_history_') and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass  # removed by another session meanwhile
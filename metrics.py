@@ -0,0 +1,142 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# --- Hot-Path Instrumentation ---
+# Process-local histograms for stage latencies and batch sizes, rendered in the Prometheus text
+# exposition format (scoring_server.py serves it on GET /metrics, the admin page shows it).
+# Modules declare their histograms at import time with histogram(...) and wrap stages in
+# `with timer(HIST, label):`. Switched off (FRAUD_METRICS=0 or set_enabled(False)), timer()
+# returns a shared no-op context manager and observe() returns immediately.
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = tuple(2 ** power for power in range(17))  # 1 .. 65536
+
+_enabled = os.environ.get('FRAUD_METRICS', '1') != '0'
+_registry = {}
+_registry_lock = threading.Lock()
+
+def is_enabled():
+    return _enabled
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+class Histogram:
+    """Cumulative-bucket histogram with optional label values, one series per label tuple."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        # Per-bucket (non-cumulative) counts; the extra slot is the +Inf bucket
+        bucket_idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket_idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        # {labels: (bucket counts, sum, count)}
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q, labels=()):
+        # Same estimate as PromQL histogram_quantile: linear interpolation inside the bucket
+        series = self.snapshot().get(labels)
+        if not series or not series[2]:
+            return None
+        counts, _, count = series
+        target = q * count
+        cumulative = 0
+        for idx, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= target and bucket_count:
+                if idx == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[idx - 1] if idx else 0.0
+                return lower + (self.buckets[idx] - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS, label_names=()):
+    # Get-or-create, so re-imported modules (Streamlit reruns) keep their accumulated series
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, help_text, buckets, label_names)
+        return _registry[name]
+
+def all_histograms():
+    with _registry_lock:
+        return list(_registry.values())
+
+def reset():
+    for hist in all_histograms():
+        hist.reset()
+
+class _Timer:
+    __slots__ = ('hist', 'labels', 'start')
+
+    def __init__(self, hist, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+_NULL_TIMER = nullcontext()
+
+def timer(hist, *labels):
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(hist, labels)
+
+def observe(hist, value, *labels):
+    if _enabled:
+        hist.observe(value, labels)
+
+# --- Prometheus Text Exposition ---
+def _format_labels(label_names, label_values, extra=None):
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus():
+    lines = []
+    for hist in sorted(all_histograms(), key=lambda hist: hist.name):
+        lines.append(f"# HELP {hist.name} {hist.help_text}")
+        lines.append(f"# TYPE {hist.name} histogram")
+        for labels, (counts, total, count) in sorted(hist.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(hist.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                bucket_labels = _format_labels(hist.label_names, labels, 'le="' + le + '"')
+                lines.append(f"{hist.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{hist.name}_sum{_format_labels(hist.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{hist.name}_count{_format_labels(hist.label_names, labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,349 @@
+import atexit
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# --- Shadow and A/B Model Variants ---
+# Candidate models run next to the primary (the served model version) without replacing it.
+# They are declared in model_variants.json (or the file named by FRAUD_VARIANTS):
+#   {"variants": [{"name": "candidate", "model": "20240101-120000", "mode": "shadow"},
+#                 {"name": "challenger", "model": "models/exp-7", "mode": "ab", "traffic": 0.05}]}
+# `model` takes the same forms as backtest.py: 'root', a models/<version> name or a directory.
+#   shadow  after the primary has answered, the same preprocessed batch goes to a small process
+#           pool whose workers hold the shadow models. Each worker scores the batch and stores
+#           its decisions next to the primary's in the shadow_predictions table, keyed by the
+#           record's Transaction_ID (when present) and an input key (see input_keys). Scoring
+#           there never holds this process's GIL and the workers run at the lowest CPU
+#           priority, so the primary's latency is unchanged. The request never waits: when too
+#           many batches are queued, new ones are dropped (and counted) for the shadows.
+#   ab      a fixed share of rows is answered by the variant instead of the primary, in-process.
+#           Rows are assigned by a hash of their feature vector, so a transaction always gets
+#           the same model (and the prediction cache stays consistent). A failing variant falls
+#           back to the primary for its rows.
+# Features arrive scaled with the primary's scaler; a variant trained with a different scaler
+# has its numerical columns re-scaled, so preprocessing runs once per batch.
+
+VARIANTS_CONFIG_PATH = './model_variants.json'
+VARIANT_MODES = ('shadow', 'ab')
+SHADOW_WORKERS = 1
+SHADOW_MAX_PENDING_BATCHES = 64
+AB_HASH_BUCKETS = 10000
+
+VARIANT_SECONDS = metrics.histogram(
+    'fraud_variant_seconds', 'Scoring time per batch for each model variant', label_names=('variant', 'mode'))
+
+class ModelVariant:
+    def __init__(self, name, spec, mode, traffic=0.0):
+        self.name = name
+        self.spec = spec
+        self.mode = mode
+        self.traffic = traffic
+        self.model = None     # loaded where the variant scores: in-process for A/B, in the workers for shadows
+        self.scaler = None
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.disagreements = 0
+        self.abs_shift_sum = 0.0
+        self.errors = 0
+        self.dropped = 0
+
+    def load(self):
+        # Imported here so inference (which imports this module) can load without a cycle
+        from inference import load_model_version
+        self.model, self.scaler = load_model_version(self.spec)
+        # One core per variant: candidates must not compete with the primary for the machine
+        self.model.n_jobs = 1
+        return self
+
+    def predict_proba(self, features, primary_scaling, classes):
+        """Class probabilities in the primary's class order; primary_scaling is its scaler's (mean_, scale_)."""
+        from inference import final_model_features, numerical_feature_idx
+        primary_mean, primary_scale = primary_scaling
+        if not (np.array_equal(self.scaler.mean_, primary_mean) and np.array_equal(self.scaler.scale_, primary_scale)):
+            features = features.copy()
+            raw = features[:, numerical_feature_idx] * primary_scale + primary_mean
+            features[:, numerical_feature_idx] = (raw - self.scaler.mean_) / self.scaler.scale_
+        proba = self.model.predict_proba(pd.DataFrame(features, columns=final_model_features))
+        variant_classes = list(self.model.classes_)
+        return proba[:, [variant_classes.index(label) for label in classes]]
+
+    def record(self, rows, seconds, disagreements=0, abs_shift_sum=0.0, error=False):
+        metrics.observe(VARIANT_SECONDS, seconds, self.name, self.mode)
+        with self._lock:
+            if error:
+                self.errors += 1
+                return
+            self.rows += rows
+            self.batches += 1
+            self.seconds += seconds
+            self.disagreements += disagreements
+            self.abs_shift_sum += abs_shift_sum
+
+    def stats(self):
+        shadow = self.mode == 'shadow'
+        with self._lock:
+            return {
+                'name': self.name,
+                'model': self.spec,
+                'mode': self.mode,
+                'traffic': None if shadow else self.traffic,
+                'rows': self.rows,
+                'batches': self.batches,
+                'mean_batch_ms': round(self.seconds / self.batches * 1000.0, 3) if self.batches else 0.0,
+                'disagreements': self.disagreements if shadow else None,
+                'disagreement_rate': round(self.disagreements / self.rows, 6) if shadow and self.rows else None,
+                'mean_abs_probability_shift': round(self.abs_shift_sum / self.rows, 6) if shadow and self.rows else None,
+                'errors': self.errors,
+                'dropped_batches': self.dropped,
+            }
+
+# --- Row Keys ---
+def input_keys(features, primary_scaling, event_times):
+    """Hex key per row from its 'MM/DD/YYYY HH:MM' event time and model inputs.
+
+    Numerical inputs are unscaled and rounded first, so the key does not depend on the scaler
+    and can be recomputed for any stored or labelled row with record_input_keys.
+    """
+    from inference import numerical_feature_idx
+    mean, scale = primary_scaling
+    rows = features.copy()
+    rows[:, numerical_feature_idx] = np.round(features[:, numerical_feature_idx] * scale + mean, 6)
+    rows += 0.0   # folds -0.0 into 0.0
+    return [hashlib.blake2b(str(event_time).encode() + row.tobytes(), digest_size=8).hexdigest()
+            for event_time, row in zip(event_times, rows)]
+
+def record_input_keys(records):
+    """input_keys for raw transactions (list of dicts, DataFrame or dict of columns)."""
+    from inference import build_feature_matrix, event_times, get_scaler
+    scaler = get_scaler()
+    return input_keys(build_feature_matrix(records, scaler), (scaler.mean_, scaler.scale_), event_times(records))
+
+# --- Shadow Worker Processes ---
+_worker_variants = None
+
+def _init_shadow_worker(specs, db_file):
+    global _worker_variants
+    import utils
+    # Lowest priority: on a busy host the shadows give up CPU to the primary, not the other way round
+    if hasattr(os, 'nice'):
+        os.nice(19)
+    utils.DB_FILE = db_file
+    _worker_variants = [ModelVariant(name, spec, 'shadow').load() for name, spec in specs]
+
+def _score_shadow_batch(features, primary_proba, primary_scaling, classes, timestamp, store, row_ids):
+    # Runs in a worker; returns (name, rows, seconds, disagreements, abs shift sum, error) per variant.
+    # row_ids is (transaction ids or None, event times) for the stored row keys.
+    fraud_col = list(classes).index(1)
+    primary_fraud = np.argmax(primary_proba, axis=1) == fraud_col
+    results, stored = [], []
+    if store:
+        transaction_ids, event_times = row_ids
+        if transaction_ids is None:
+            transaction_ids = [None] * len(features)
+        transaction_ids = [None if value is None else str(value) for value in transaction_ids]
+        keys = input_keys(features, primary_scaling, event_times)
+    for variant in _worker_variants:
+        start = time.perf_counter()
+        try:
+            proba = variant.predict_proba(features, primary_scaling, classes)
+        except Exception:
+            results.append((variant.name, 0, time.perf_counter() - start, 0, 0.0, True))
+            continue
+        elapsed = time.perf_counter() - start
+        fraud = np.argmax(proba, axis=1) == fraud_col
+        results.append((variant.name, len(features), elapsed, int(np.count_nonzero(fraud != primary_fraud)),
+                        float(np.abs(proba[:, fraud_col] - primary_proba[:, fraud_col]).sum()), False))
+        if store:
+            stored += [
+                (variant.name, timestamp, transaction_id, key, 'Fraud' if primary_is_fraud else 'Legit',
+                 round(float(primary_p), 4), 'Fraud' if is_fraud else 'Legit', round(float(p), 4))
+                for transaction_id, key, primary_is_fraud, primary_p, is_fraud, p in
+                zip(transaction_ids, keys, primary_fraud, primary_proba[:, fraud_col], fraud, proba[:, fraud_col])
+            ]
+    return results, _store_shadow_rows(stored) if stored else True
+
+def _store_shadow_rows(rows):
+    import sqlite3
+    import utils
+    conn = None
+    try:
+        conn = utils.get_db_connection()
+        with conn:
+            conn.executemany("INSERT INTO shadow_predictions (variant, timestamp, transaction_id, input_key, "
+                             "primary_prediction, primary_probability, prediction, probability) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+class VariantRegistry:
+    def __init__(self, variants, store=True, workers=SHADOW_WORKERS, max_pending=SHADOW_MAX_PENDING_BATCHES):
+        self.variants = variants
+        self.shadow_variants = [variant for variant in variants if variant.mode == 'shadow']
+        self.ab_variants = [variant.load() for variant in variants if variant.mode == 'ab']
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self.store_failures = 0
+        self.worker_restarts = 0
+
+        # A/B: each variant owns a contiguous range of hash buckets, the primary keeps the rest
+        self._ab_bounds = np.cumsum([round(variant.traffic * AB_HASH_BUCKETS) for variant in self.ab_variants]).astype(np.int64)
+        self._hash_weights = None
+
+    # --- A/B ---
+    def assign(self, features):
+        """Index into ab_variants per row, or -1 for the primary."""
+        if self._hash_weights is None or len(self._hash_weights) != features.shape[1]:
+            self._hash_weights = np.random.default_rng(0).integers(1, 2 ** 62, size=features.shape[1], dtype=np.uint64)
+        bits = np.ascontiguousarray(features + 0.0).view(np.uint64)   # +0.0 folds -0.0 into 0.0
+        hashes = (bits * self._hash_weights).sum(axis=1, dtype=np.uint64)   # wraps modulo 2**64
+        hashes ^= hashes >> np.uint64(29)
+        buckets = (hashes % np.uint64(AB_HASH_BUCKETS)).astype(np.int64)
+        assignment = np.searchsorted(self._ab_bounds, buckets, side='right')
+        assignment[assignment >= len(self.ab_variants)] = -1
+        return assignment
+
+    def score_ab(self, features, primary_proba, primary_scaler, classes):
+        assignment = self.assign(features)
+        primary_rows = assignment == -1
+        proba = np.empty((len(features), len(classes)), dtype=np.float64)
+        for idx, variant in enumerate(self.ab_variants):
+            rows = np.flatnonzero(assignment == idx)
+            if not len(rows):
+                continue
+            start = time.perf_counter()
+            try:
+                proba[rows] = variant.predict_proba(features[rows], (primary_scaler.mean_, primary_scaler.scale_), classes)
+                variant.record(len(rows), time.perf_counter() - start)
+            except Exception:
+                variant.record(0, time.perf_counter() - start, error=True)
+                primary_rows[rows] = True
+        primary_idx = np.flatnonzero(primary_rows)
+        if len(primary_idx):
+            proba[primary_idx] = primary_proba(features[primary_idx])
+        return proba
+
+    # --- Shadow ---
+    def _get_executor(self):
+        # Started on first use. Spawned rather than forked: the serving process has live threads.
+        if self._executor is None:
+            import utils
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_shadow_worker,
+                initargs=([(variant.name, variant.spec) for variant in self.shadow_variants], utils.DB_FILE))
+            atexit.register(self.shutdown)
+        return self._executor
+
+    def submit_shadow(self, features, proba, primary_scaler, classes, transaction_ids=None, event_times=()):
+        # Never blocks on shadow work: returns False when the batch was dropped for the shadows
+        with self._lock:
+            if self._pending >= self.max_pending:
+                for variant in self.shadow_variants:
+                    with variant._lock:
+                        variant.dropped += 1
+                return False
+            self._pending += 1
+            executor = self._get_executor()
+        try:
+            future = executor.submit(_score_shadow_batch, features, proba, (primary_scaler.mean_, primary_scaler.scale_),
+                                     np.asarray(classes), datetime.now().isoformat(), self.store,
+                                     (transaction_ids, event_times))
+        except (BrokenProcessPool, RuntimeError):
+            # The pool broke (or was shut down) before its callbacks reset it
+            self._pool_failed(executor)
+            return False
+        future.add_done_callback(functools.partial(self._shadow_done, executor))
+        return True
+
+    def _pool_failed(self, executor):
+        # A worker died (e.g. killed for memory). Only the first report for the current pool replaces
+        # it; the other batches that were pending on the same pool just count as errors.
+        with self._lock:
+            self._pending -= 1
+            restart = self._executor is executor
+            if restart:
+                self._executor = None
+                self.worker_restarts += 1
+        if restart:
+            executor.shutdown(wait=False)
+        for variant in self.shadow_variants:
+            variant.record(0, 0.0, error=True)
+
+    def _shadow_done(self, executor, future):
+        variants = {variant.name: variant for variant in self.shadow_variants}
+        try:
+            results, stored = future.result()
+        except BrokenProcessPool:
+            self._pool_failed(executor)
+            return
+        except Exception:
+            results, stored = [(name, 0, 0.0, 0, 0.0, True) for name in variants], True
+        for name, rows, seconds, disagreements, abs_shift_sum, error in results:
+            variants[name].record(rows, seconds, disagreements, abs_shift_sum, error)
+        with self._lock:
+            self._pending -= 1
+            if not stored:
+                self.store_failures += 1
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            registry_stats = {
+                'pending_shadow_batches': self._pending,
+                'store_failures': self.store_failures,
+                'worker_restarts': self.worker_restarts,
+            }
+        return {**registry_stats, 'variants': [variant.stats() for variant in self.variants]}
+
+def load_registry(path=VARIANTS_CONFIG_PATH):
+    from inference import version_artifact_paths
+
+    with open(path) as f:
+        config = json.load(f)
+    variants = []
+    for entry in config.get('variants', []):
+        mode = entry.get('mode', 'shadow')
+        if mode not in VARIANT_MODES:
+            raise ValueError(f"Variant {entry.get('name')!r}: mode must be one of {VARIANT_MODES}")
+        traffic = float(entry.get('traffic', 0.0))
+        if mode == 'ab' and not 0.0 < traffic <= 1.0:
+            raise ValueError(f"Variant {entry.get('name')!r}: A/B traffic must be in (0, 1]")
+        # Shadow models load in the workers; a bad path should fail here, not in every worker start
+        model_file = version_artifact_paths(entry['model'])[0]
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"Variant {entry.get('name')!r}: no model artifact at {model_file}")
+        variants.append(ModelVariant(entry['name'], entry['model'], mode, traffic))
+    if sum(variant.traffic for variant in variants if variant.mode == 'ab') > 1.0:
+        raise ValueError("A/B traffic shares add up to more than 1")
+    if len({variant.name for variant in variants}) != len(variants):
+        raise ValueError("Variant names must be unique")
+    if not variants:
+        return None
+    return VariantRegistry(variants, store=config.get('store', True), workers=config.get('workers', SHADOW_WORKERS))
@@ -1,9 +1,11 @@
-
 import streamlit as st
 import pandas as pd
+import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-import io
+
+from eda_stats import EDA_CSV_PATH, eda_numerical_cols, eda_categorical_cols, target_col, load_eda_summary
+from fingerprints import file_fingerprint
 
 # Set page configuration
 st.set_page_config(page_title="Dataset Information and EDA", layout="wide")
@@ -15,58 +17,69 @@ st.markdown("This page provides an overview of the dataset structure, statistics
 if 'logged_in' not in st.session_state or not st.session_state.logged_in:
     st.warning("Please log in to view dataset information and EDA.")
 else:
-    # Load the dataset
+    # Load the precomputed summary (see eda_stats.py); the size/mtime arguments make the
+    # cache follow changes to the CSV. The sidecar file is only rebuilt when the data changed.
     @st.cache_data
-    def load_data():
-        df = pd.read_csv('./card_fraud.csv')
-        return df
+    def load_summary(csv_path, size, mtime):
+        return load_eda_summary(csv_path)
+
+    fingerprint = file_fingerprint(EDA_CSV_PATH)
+    with st.spinner("Loading dataset summary..."):
+        summary = load_summary(EDA_CSV_PATH, fingerprint['size'], fingerprint['mtime'])
 
-    df = load_data()
+    class_labels = {'0': 'Not Fraud (0)', '1': 'Fraud (1)'}
 
     st.subheader("Dataset Overview")
-    st.write(f"DataFrame has {df.shape[0]} rows and {df.shape[1]} columns.")
+    st.write(f"DataFrame has {summary['n_rows']} rows and {summary['n_columns']} columns.")
 
     st.subheader("DataFrame Info (Column Details):")
 
     # Create a DataFrame for df.info() details for better formatting
-    info_data = []
-    for col in df.columns:
-        info_data.append({
-            'Column Name': col,
-            'Data Type': df[col].dtype,
-            'Non-Null Count': df[col].count(),
-            'Null Count': df[col].isnull().sum(),
-            'Unique Values': df[col].nunique() # Added for categorical insights
-        })
-    info_df = pd.DataFrame(info_data)
+    info_df = pd.DataFrame([
+        {
+            'Column Name': col['name'],
+            'Data Type': col['dtype'],
+            'Non-Null Count': col['non_null'],
+            'Null Count': col['nulls'],
+            'Unique Values': f"≥{col['unique']}" if col['unique_is_lower_bound'] else col['unique']
+        }
+        for col in summary['columns']
+    ])
     st.dataframe(info_df)
 
     st.subheader("Descriptive Statistics:")
-    st.dataframe(df.describe())
+    st.dataframe(pd.DataFrame(summary['describe']))
+    st.caption("Quartiles are computed from a fine-grained histogram and are accurate to within one bin width.")
 
     # Numerical Features Distribution
-    numerical_cols = [
-        'Transaction_Amount',
-        'Previous_Transaction_Count',
-        'Distance_Between_Transactions_km',
-        'Time_Since_Last_Transaction_min',
-        'Transaction_Velocity'
-    ]
-
     st.subheader("Distribution of Numerical Features")
-    for col in numerical_cols:
+    for col in eda_numerical_cols:
+        if col not in summary['histograms']:
+            continue
         st.markdown(f"#### {col}")
         fig, axes = plt.subplots(1, 2, figsize=(15, 5))
 
-        # Histogram
-        sns.histplot(df[col], kde=True, ax=axes[0])
+        # Histogram (stacked by class)
+        histogram = summary['histograms'][col]
+        edges = np.asarray(histogram['edges'])
+        bottom = np.zeros(len(edges) - 1)
+        colors = sns.color_palette(n_colors=len(histogram['counts']))
+        for color, (cls, counts) in zip(colors, histogram['counts'].items()):
+            axes[0].bar(edges[:-1], counts, width=np.diff(edges), bottom=bottom, align='edge',
+                        color=color, alpha=0.8, label=class_labels.get(cls, cls))
+            bottom += np.asarray(counts)
+        if len(histogram['counts']) > 1:
+            axes[0].legend(title=target_col)
         axes[0].set_title(f'Histogram of {col}')
         axes[0].set_xlabel(col)
         axes[0].set_ylabel('Frequency')
 
-        # Box plot
-        sns.boxplot(x=df[col], ax=axes[1])
-        axes[1].set_title(f'Box Plot of {col}')
+        # Box plot from the precomputed five-number summary
+        box = dict(summary['boxplots'][col])
+        outliers = box.pop('outliers')
+        axes[1].bxp([box], orientation='horizontal', showfliers=False, widths=0.6)
+        axes[1].set_yticks([])
+        axes[1].set_title(f'Box Plot of {col}' + (f' ({outliers} outliers)' if outliers else ''))
         axes[1].set_xlabel(col)
 
         plt.tight_layout()
@@ -74,20 +87,16 @@ else:
         plt.close(fig)
 
     # Categorical Features Distribution
-    categorical_cols_to_plot = [
-        'Transaction_Location',
-        'Card_Type',
-        'Transaction_Currency',
-        'Transaction_Status',
-        'Authentication_Method',
-        'Transaction_Category'
-    ]
-
     st.subheader("Distribution of Categorical Features")
-    for col in categorical_cols_to_plot:
+    for col in eda_categorical_cols:
+        if col not in summary['value_counts']:
+            continue
         st.markdown(f"#### {col}")
+        counts = summary['value_counts'][col]
+        values = list(counts)
+        totals = [sum(class_counts.values()) for class_counts in counts.values()]
         fig, ax = plt.subplots(figsize=(10, 6))
-        sns.countplot(data=df, x=col, hue=col, palette='viridis', legend=False, ax=ax)
+        ax.bar(values, totals, color=sns.color_palette('viridis', n_colors=len(values)))
         ax.set_title(f'Distribution of {col}')
         ax.set_xlabel(col)
         ax.set_ylabel('Count')
@@ -96,16 +105,28 @@ else:
         st.pyplot(fig)
         plt.close(fig)
 
+        # Per-class split from the same counts
+        fraud_rate = pd.DataFrame({
+            col: values,
+            'Count': totals,
+            'Fraud Count': [class_counts.get('1', 0) for class_counts in counts.values()],
+        })
+        fraud_rate['Fraud Rate'] = (fraud_rate['Fraud Count'] / fraud_rate['Count']).round(4)
+        st.dataframe(fraud_rate, hide_index=True)
+
     # Target Variable Distribution
-    st.subheader("Distribution of Target Variable ('isFraud')")
-    fig, ax = plt.subplots(figsize=(7, 5))
-    sns.countplot(data=df, x='isFraud', palette='coolwarm', ax=ax)
-    ax.set_title('Distribution of isFraud Target Variable')
-    ax.set_xlabel('Is Fraudulent Transaction')
-    ax.set_ylabel('Count')
-    ax.set_xticks(ticks=[0, 1], labels=['Not Fraud (0)', 'Fraud (1)'])
-    plt.tight_layout()
-    st.pyplot(fig)
-    plt.close(fig)
+    if target_col in summary['value_counts']:
+        st.subheader("Distribution of Target Variable ('isFraud')")
+        target_counts = summary['value_counts'][target_col]
+        fig, ax = plt.subplots(figsize=(7, 5))
+        ax.bar([0, 1], [sum(target_counts.get(cls, {}).values()) for cls in ('0', '1')],
+               color=sns.color_palette('coolwarm', n_colors=2))
+        ax.set_title('Distribution of isFraud Target Variable')
+        ax.set_xlabel('Is Fraudulent Transaction')
+        ax.set_ylabel('Count')
+        ax.set_xticks(ticks=[0, 1], labels=['Not Fraud (0)', 'Fraud (1)'])
+        plt.tight_layout()
+        st.pyplot(fig)
+        plt.close(fig)
 
     st.success("Dataset Information and EDA page loaded successfully!")
@@ -2,11 +2,23 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-import json
 from datetime import datetime
-# Import necessary functions/objects from app.py and utils.py
-from app import predict_transaction, model, scaler, categorical_cols_for_ohe, numerical_cols_to_scale, final_model_features
-from utils import get_db_connection
+# Import necessary functions/objects from inference.py and utils.py
+# (inference.py has no Streamlit code, so importing it does not re-run app.py)
+from inference import predict_transaction, predict_transactions
+from utils import get_db_connection, insert_transactions
+from audit_log import get_audit_log
+from feature_engine import STREAM_FEATURES, enrich_records, event_minute, feature_key, get_feature_engine
+
+# Columns persisted as raw_input for bulk-scored rows (same fields as the single-transaction form)
+raw_input_columns = [
+    'Transaction_Amount', 'Transaction_Date', 'Transaction_Time', 'Transaction_Location',
+    'Card_Type', 'Transaction_Currency', 'Transaction_Status', 'Previous_Transaction_Count',
+    'Distance_Between_Transactions_km', 'Time_Since_Last_Transaction_min', 'Authentication_Method',
+    'Transaction_Velocity', 'Transaction_Category', 'Merchant_ID', 'Device_ID'
+]
+required_bulk_columns = [col for col in raw_input_columns if col not in ('Merchant_ID', 'Device_ID')]
+BULK_CHUNK_SIZE = 50000
 
 # Set page configuration
 st.set_page_config(page_title="Fraud Prediction", layout="wide")
@@ -18,6 +30,13 @@ st.markdown("Input the details of a transaction below to get an instant fraud pr
 if 'logged_in' not in st.session_state or not st.session_state.logged_in:
     st.warning("Please log in to make fraud predictions.")
 else:
+    # Velocity/recency inputs can come from the streaming feature engine, keyed by the card being scored
+    derive_stream_features = st.toggle(
+        "Derive velocity and recency features from the card's transaction stream", value=False,
+        help="Previous count, time since last transaction, distance and velocity are computed from the "
+             "earlier transactions scored here for the same card ID instead of entered by hand."
+    )
+
     # Interactive form for transaction details
     with st.form("fraud_prediction_form"):
         st.subheader("Enter Transaction Details")
@@ -39,17 +58,37 @@ else:
             authentication_method = st.selectbox("Authentication Method", ['2FA', 'Biometric', 'Password'], index=2) # Default to Password
 
         with col3:
-            previous_transaction_count = st.slider("Previous Transaction Count", 1, 50, 25)
-            distance_between_transactions_km = st.slider("Distance Between Transactions (km)", 0.0, 5000.0, 1500.0, step=1.0)
-            time_since_last_transaction_min = st.slider("Time Since Last Transaction (min)", 1, 1440, 500)
-            transaction_velocity = st.slider("Transaction Velocity (transactions/hour)", 1, 10, 6)
+            if derive_stream_features:
+                card_id = st.text_input("Card ID", help="Identifies the card whose transaction stream the "
+                                                       "velocity and recency features are derived from.")
+            else:
+                previous_transaction_count = st.slider("Previous Transaction Count", 1, 50, 25)
+                distance_between_transactions_km = st.slider("Distance Between Transactions (km)", 0.0, 5000.0, 1500.0, step=1.0)
+                time_since_last_transaction_min = st.slider("Time Since Last Transaction (min)", 1, 1440, 500)
+                transaction_velocity = st.slider("Transaction Velocity (transactions/hour)", 1, 10, 6)
             transaction_category = st.selectbox("Transaction Category", [
                 'Cash In', 'Cash Out', 'Payment', 'Transfer'
             ], index=2) # Default to Payment
 
         submitted = st.form_submit_button("Predict Fraud")
 
-        if submitted:
+        if submitted and derive_stream_features and not card_id.strip():
+            st.error("Enter the card ID to derive its velocity and recency features.")
+        elif submitted:
+            if derive_stream_features:
+                stream_features = get_feature_engine().update(
+                    feature_key({'Card_ID': card_id.strip()}),
+                    event_minute(transaction_date.strftime('%m/%d/%Y'), transaction_time.strftime('%H:%M')),
+                    transaction_location
+                )
+                previous_transaction_count = stream_features['Previous_Transaction_Count']
+                distance_between_transactions_km = stream_features['Distance_Between_Transactions_km']
+                time_since_last_transaction_min = stream_features['Time_Since_Last_Transaction_min']
+                transaction_velocity = stream_features['Transaction_Velocity']
+                st.caption(f"Derived features: {previous_transaction_count} previous transactions, "
+                           f"{time_since_last_transaction_min} min since the last one, "
+                           f"{distance_between_transactions_km} km away, {transaction_velocity} in the last hour.")
+
             # Prepare raw input data for prediction
             raw_input = {
                 'Transaction_Amount': transaction_amount,
@@ -80,23 +119,78 @@ else:
 
             # Record the prediction in the database if user is logged in
             if st.session_state.logged_in and st.session_state.user_id:
-                try:
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-
-                    timestamp = datetime.now().isoformat()
-                    raw_input_json = json.dumps(raw_input)
-
-                    cursor.execute(
-                        "INSERT INTO transactions (user_id, timestamp, raw_input, prediction, probability) VALUES (?, ?, ?, ?, ?)",
-                        (st.session_state.user_id, timestamp, raw_input_json, status, prob)
-                    )
-                    conn.commit()
+                # Written to SQLite by the background audit-log writer, off the request path
+                timestamp = datetime.now().isoformat()
+                if get_audit_log().log_prediction(st.session_state.user_id, timestamp, raw_input, status, prob):
                     st.info("Prediction successfully recorded in your transaction history.")
-                except sqlite3.Error as e:
-                    st.error(f"Error recording transaction history: {e}")
-                finally:
-                    if conn:
-                        conn.close()
+                else:
+                    st.error("Error recording transaction history: the audit log queue is full.")
             else:
                 st.warning("Log in to record your prediction in the transaction history.")
+
+    # --- Bulk Scoring (CSV / Parquet upload) ---
+    st.subheader("Bulk Scoring")
+    st.markdown("Upload a file in the `card_fraud.csv` schema to score every transaction. "
+                "The file is processed in fixed-size chunks, so memory stays bounded regardless of file size.")
+
+    def iter_upload_chunks(uploaded_file, chunk_size):
+        # Yields (chunk DataFrame, fraction of the file processed so far)
+        if uploaded_file.name.lower().endswith('.parquet'):
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(uploaded_file)
+            total_rows = max(parquet_file.metadata.num_rows, 1)
+            rows_done = 0
+            for batch in parquet_file.iter_batches(batch_size=chunk_size):
+                chunk = batch.to_pandas()
+                rows_done += len(chunk)
+                yield chunk, rows_done / total_rows
+        else:
+            total_bytes = max(uploaded_file.size, 1)
+            # Dates and times stay strings so they parse with the same format as the single form
+            reader = pd.read_csv(uploaded_file, chunksize=chunk_size,
+                                 dtype={'Transaction_Date': str, 'Transaction_Time': str})
+            for chunk in reader:
+                yield chunk, min(uploaded_file.tell() / total_bytes, 1.0)
+
+    uploaded_file = st.file_uploader("Upload transactions (CSV or Parquet)", type=['csv', 'parquet'])
+    if uploaded_file is not None and st.button("Score File"):
+        progress_bar = st.progress(0.0, text="Scoring transactions...")
+        total_scored = 0
+        total_fraud = 0
+        conn = None
+        try:
+            conn = get_db_connection()
+            for chunk, fraction_done in iter_upload_chunks(uploaded_file, BULK_CHUNK_SIZE):
+                # Files without the velocity/recency columns get them from the feature engine,
+                # provided each row names its card, device or user (rows are taken in file order)
+                if any(col not in chunk.columns for col in STREAM_FEATURES) and \
+                        any(col in chunk.columns for col in ('Card_ID', 'Device_ID', 'User_ID')):
+                    chunk = pd.DataFrame(enrich_records(chunk.to_dict('records')))
+
+                missing_cols = [col for col in required_bulk_columns if col not in chunk.columns]
+                if missing_cols:
+                    st.error(f"Uploaded file is missing required columns: {', '.join(missing_cols)}")
+                    break
+
+                # Uploaded rows rarely repeat: skip the prediction cache and shadow scoring
+                labels, probabilities = predict_transactions(chunk, use_cache=False, shadow=False)
+
+                chunk_raw = chunk.reindex(columns=raw_input_columns, fill_value=0)
+                timestamp = datetime.now().isoformat()
+                insert_transactions(conn, (
+                    (st.session_state.user_id, timestamp, record, label, float(prob))
+                    for record, label, prob in zip(chunk_raw.to_dict('records'), labels, probabilities)
+                ))
+
+                total_scored += len(chunk)
+                total_fraud += int((labels == "Fraud").sum())
+                progress_bar.progress(fraction_done, text=f"Scored {total_scored:,} transactions...")
+            else:
+                progress_bar.progress(1.0, text="Scoring complete.")
+                st.success(f"Scored {total_scored:,} transactions: {total_fraud:,} flagged as fraud. "
+                           "Results were recorded in your transaction history.")
+        except (sqlite3.Error, ValueError, KeyError) as e:
+            st.error(f"Error during bulk scoring after {total_scored:,} transactions: {e}")
+        finally:
+            if conn:
+                conn.close()
@@ -1,13 +1,14 @@
-
 import streamlit as st
 import pandas as pd
 import sqlite3
-import json
-from datetime import datetime
-import io
+from datetime import datetime, timedelta
+import os
 
 # Import necessary functions/objects from utils.py
-from utils import get_db_connection
+from utils import get_db_connection, count_transactions, fetch_transactions_page
+from audit_log import get_audit_log
+from history_export import EXPORT_FORMATS, create_history_export, remove_export
+from user_aggregates import daily_stats
 
 # Set page configuration
 st.set_page_config(page_title="User Transaction History", layout="wide")
@@ -15,6 +16,8 @@ st.set_page_config(page_title="User Transaction History", layout="wide")
 st.title("📜 Your Transaction History")
 st.markdown("View and download your past transaction predictions.")
 
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250]
+
 # Check if user is logged in
 if 'logged_in' not in st.session_state or not st.session_state.logged_in:
     st.warning("Please log in to view your transaction history.")
@@ -22,56 +25,102 @@ else:
     user_id = st.session_state.user_id
     st.write(f"Welcome, {st.session_state.username}! Here are your recorded transactions:")
 
+    # Make sure predictions still waiting in the write-behind audit log are visible
+    get_audit_log().flush()
+
+    # --- Filters (applied in SQL) ---
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+    with filter_col1:
+        date_range = st.date_input("Date range", value=(), key="history_date_range")
+    with filter_col2:
+        prediction_filter = st.selectbox("Prediction", ['All', 'Fraud', 'Legit'], key="history_prediction")
+    with filter_col3:
+        min_probability = st.slider("Minimum probability", 0.0, 1.0, 0.0, step=0.01, key="history_min_probability")
+    with filter_col4:
+        page_size = st.selectbox("Rows per page", PAGE_SIZE_OPTIONS, index=1, key="history_page_size")
+
+    filters = {
+        'start_timestamp': date_range[0].isoformat() if len(date_range) > 0 else None,
+        # End date is inclusive: everything before the start of the following day
+        'end_timestamp': (date_range[-1] + timedelta(days=1)).isoformat() if len(date_range) > 0 else None,
+        'prediction': None if prediction_filter == 'All' else prediction_filter,
+        'min_probability': min_probability if min_probability > 0.0 else None,
+    }
+
+    # Keyset cursors: one (timestamp, id) per page already visited; reset when filters change
+    filter_key = (user_id, tuple(sorted(filters.items())), page_size)
+    if st.session_state.get('history_filter_key') != filter_key:
+        st.session_state.history_filter_key = filter_key
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
     conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT timestamp, raw_input, prediction, probability FROM transactions WHERE user_id = ? ORDER BY timestamp DESC",
-            (user_id,)
-        )
-        records = cursor.fetchall()
-
-        if records:
-            # Convert records to a list of dictionaries for easier DataFrame creation
-            transaction_data = []
-            for record in records:
-                row_dict = dict(record)
-                raw_input_dict = json.loads(row_dict['raw_input'])
-                # Merge raw_input details with other record details
-                transaction_data.append({
-                    'Timestamp': row_dict['timestamp'],
-                    'Prediction': row_dict['prediction'],
-                    'Probability': row_dict['probability'],
-                    **raw_input_dict # Expand raw_input dictionary into individual columns
-                })
-
-            df_history = pd.DataFrame(transaction_data)
-
-            # Reorder columns for better readability, putting prediction first
-            cols = ['Timestamp', 'Prediction', 'Probability'] + \
-                   [col for col in df_history.columns if col not in ['Timestamp', 'Prediction', 'Probability']]
-            df_history = df_history[cols]
+
+        total_count, fraud_count = count_transactions(conn, user_id, **filters)
+
+        if total_count:
+            metric_col1, metric_col2, metric_col3 = st.columns(3)
+            metric_col1.metric("Matching transactions", f"{total_count:,}")
+            metric_col2.metric("Flagged as fraud", f"{fraud_count:,}")
+            metric_col3.metric("Fraud rate", f"{fraud_count / total_count:.2%}")
+
+            # Daily counts come from the per-user aggregates (date range only; see the Analytics page)
+            with st.expander("Daily activity"):
+                daily = daily_stats(conn, user_id, filters['start_timestamp'], filters['end_timestamp'])
+                daily_df = pd.DataFrame([tuple(row) for row in daily],
+                                        columns=['Day', 'Transactions', 'Fraud', 'Probability_Sum'])
+                st.bar_chart(daily_df.assign(Day=pd.to_datetime(daily_df['Day'])).set_index('Day')[['Transactions', 'Fraud']])
+
+            records = fetch_transactions_page(conn, user_id, page_size, before=cursors[-1], **filters)
+            df_history = pd.DataFrame([tuple(record) for record in records], columns=records[0].keys())
 
             st.subheader("Transaction List")
-            st.dataframe(df_history)
-
-            # --- Excel Export Functionality ---
-            def to_excel(df):
-                output = io.BytesIO()
-                writer = pd.ExcelWriter(output, engine='xlsxwriter')
-                df.to_excel(writer, index=False, sheet_name='Transaction History')
-                writer.close()
-                processed_data = output.getvalue()
-                return processed_data
-
-            st.download_button(
-                label="Download History as Excel",
-                data=to_excel(df_history),
-                file_name=f"transaction_history_{st.session_state.username}_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            page_number = len(cursors)
+            total_pages = (total_count + page_size - 1) // page_size
+            st.dataframe(df_history.drop(columns=['id']))
+
+            nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+            with nav_col1:
+                if st.button("⬅ Newer", disabled=page_number == 1):
+                    cursors.pop()
+                    st.rerun()
+            with nav_col2:
+                st.write(f"Page {page_number} of {total_pages}")
+            with nav_col3:
+                if st.button("Older ➡", disabled=page_number >= total_pages):
+                    last = records[-1]
+                    cursors.append((last['Timestamp'], last['id']))
+                    st.rerun()
+
+            # --- Export Functionality (streamed from SQLite into a temp file) ---
+            st.subheader("Export")
+            export_col1, export_col2 = st.columns([1, 3])
+            with export_col1:
+                export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="history_export_format")
+            with export_col2:
+                if st.button("Prepare export"):
+                    remove_export(st.session_state.get('history_export_path'))
+                    with st.spinner("Writing export..."):
+                        export_path, export_rows = create_history_export(user_id, export_format, **filters)
+                    st.session_state.history_export_path = export_path
+                    st.session_state.history_export_prepared_format = export_format
+                    st.session_state.history_export_rows = export_rows
+
+            export_path = st.session_state.get('history_export_path')
+            if export_path and os.path.exists(export_path):
+                prepared_format = st.session_state.history_export_prepared_format
+                suffix, mime = EXPORT_FORMATS[prepared_format]
+                with open(export_path, 'rb') as export_file:
+                    st.download_button(
+                        label=f"Download History as {prepared_format} ({st.session_state.history_export_rows:,} rows)",
+                        data=export_file,
+                        file_name=f"transaction_history_{st.session_state.username}_{datetime.now().strftime('%Y%m%d%H%M%S')}{suffix}",
+                        mime=mime,
+                        # Streamlit has read the file into its media store by now; the copy on disk can go
+                        on_click=remove_export, args=(export_path,)
+                    )
         else:
             st.info("No transaction history found for your account.")
 
@@ -0,0 +1,117 @@
+import os
+import streamlit as st
+import pandas as pd
+
+import metrics
+# Importing these registers their histograms, even before the first prediction in this session
+import inference
+import utils
+
+# Set page configuration
+st.set_page_config(page_title="Performance Metrics", layout="wide")
+
+st.title("⏱️ Performance Metrics")
+st.markdown("Per-stage latency and batch-size histograms for the scoring path and database, "
+            "collected in this app process since it started (or since the last reset).")
+
+# Comma-separated usernames allowed on this page. Registration is open, so the page is closed
+# unless this is set: its toggles change scoring for every user of the process
+admin_users = [name.strip() for name in os.environ.get('FRAUD_ADMIN_USERS', '').split(',') if name.strip()]
+
+# Check if user is logged in
+if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+    st.warning("Please log in to view performance metrics.")
+elif not admin_users:
+    st.error("This page is only available to administrators, and none are configured. "
+             "Set `FRAUD_ADMIN_USERS` to a comma-separated list of usernames.")
+elif st.session_state.username not in admin_users:
+    st.error("This page is only available to administrators.")
+else:
+    control_col1, control_col2 = st.columns([3, 1])
+    with control_col1:
+        enabled = st.toggle("Collect metrics", value=metrics.is_enabled(),
+                            help="When off, the timers are no-ops and the scoring path pays almost nothing.")
+        if enabled != metrics.is_enabled():
+            metrics.set_enabled(enabled)
+    with control_col2:
+        if st.button("Reset all metrics"):
+            metrics.reset()
+            st.success("Metrics reset.")
+
+    # One row per series: count, mean and bucket-estimated percentiles
+    rows = []
+    for hist in metrics.all_histograms():
+        is_latency = hist.buckets == metrics.LATENCY_BUCKETS
+        scale = 1000.0 if is_latency else 1.0
+        for labels, (_, total, count) in hist.snapshot().items():
+            if not count:
+                continue
+            rows.append({
+                'Metric': hist.name,
+                'Series': ', '.join(f'{name}={value}' for name, value in zip(hist.label_names, labels)) or '-',
+                'Unit': 'ms' if is_latency else 'rows',
+                'Count': count,
+                'Mean': total / count * scale,
+                'p50': hist.quantile(0.50, labels) * scale,
+                'p95': hist.quantile(0.95, labels) * scale,
+                'p99': hist.quantile(0.99, labels) * scale,
+            })
+
+    if not rows:
+        st.info("No observations yet. Make some predictions, then come back to this page.")
+    else:
+        metrics_df = pd.DataFrame(rows).sort_values(['Metric', 'Series']).reset_index(drop=True)
+        st.subheader("Summary")
+        st.dataframe(metrics_df.style.format({'Mean': '{:.3f}', 'p50': '{:.3f}', 'p95': '{:.3f}', 'p99': '{:.3f}'}),
+                     hide_index=True)
+
+        stage_df = metrics_df[metrics_df['Metric'] == inference.SCORING_STAGE_SECONDS.name]
+        if not stage_df.empty:
+            st.subheader("Scoring Stages (p95, ms)")
+            st.bar_chart(stage_df.assign(Stage=stage_df['Series'].str.replace('stage=', '', regex=False))
+                         .set_index('Stage')['p95'])
+
+        db_df = metrics_df[metrics_df['Metric'] == utils.DB_QUERY_SECONDS.name]
+        if not db_df.empty:
+            st.subheader("Database Statements (p95, ms)")
+            st.bar_chart(db_df.assign(Operation=db_df['Series'].str.replace('operation=', '', regex=False))
+                         .set_index('Operation')['p95'])
+
+    st.subheader("Prediction Cache")
+    st.json(inference.get_prediction_cache().stats())
+
+    st.subheader("Cascade Pre-filter")
+    cascade = inference.get_cascade()
+    if cascade is None:
+        st.info("No current cascade calibration. Run `python cascade.py train` to enable the cascade mode.")
+    else:
+        use_cascade = st.toggle("Score through the cascade", value=inference.cascade_enabled(),
+                                help="A linear pre-filter settles confident cases; only the uncertain band reaches the forest.")
+        if use_cascade != inference.cascade_enabled():
+            inference.set_cascade_enabled(use_cascade)
+        report = cascade.report
+        report_col1, report_col2, report_col3 = st.columns(3)
+        report_col1.metric("Short-circuited (calibration)", f"{report['short_circuit_rate']:.1%}")
+        report_col2.metric("Fraud recall", f"{report['cascade_recall']:.2%}",
+                           delta=f"{report['cascade_recall'] - report['forest_recall']:+.2%} vs forest")
+        report_col3.metric("Fraud precision", f"{report['cascade_precision']:.2%}",
+                           delta=f"{report['cascade_precision'] - report['forest_precision']:+.2%} vs forest")
+        if report.get('note'):
+            st.caption(report['note'])
+        st.json(cascade.stats())
+
+    st.subheader("Model Variants")
+    registry = inference.get_variant_registry()
+    if registry is None:
+        st.info("No shadow or A/B variants configured. Declare them in `model_variants.json` to compare "
+                "candidate models on live traffic.")
+    else:
+        registry_stats = registry.stats()
+        st.dataframe(pd.DataFrame(registry_stats['variants']), hide_index=True)
+        st.caption(f"Shadow batches queued: {registry_stats['pending_shadow_batches']} · "
+                   f"failed result writes: {registry_stats['store_failures']}")
+
+    with st.expander("Prometheus text format"):
+        prometheus_text = metrics.render_prometheus()
+        st.code(prometheus_text, language=None)
+        st.download_button("Download metrics.prom", prometheus_text, file_name="metrics.prom", mime="text/plain")
@@ -0,0 +1,88 @@
+import streamlit as st
+import pandas as pd
+import sqlite3
+from datetime import timedelta
+
+from utils import get_db_connection
+from audit_log import get_audit_log
+from user_aggregates import PROBABILITY_BUCKETS, daily_stats, hourly_stats, user_summary
+
+# Set page configuration
+st.set_page_config(page_title="User Analytics", layout="wide")
+
+st.title("📈 Your Fraud Analytics")
+st.markdown("Counts, fraud rates, trends and the probability distribution of your predictions, "
+            "read from per-day and per-hour summary tables rather than your full history.")
+
+# Check if user is logged in
+if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+    st.warning("Please log in to view your analytics.")
+else:
+    user_id = st.session_state.user_id
+
+    # Predictions still waiting in the write-behind audit log are not in the aggregates yet
+    get_audit_log().flush()
+
+    date_range = st.date_input("Date range", value=(), key="analytics_date_range")
+    start_day = date_range[0].isoformat() if len(date_range) > 0 else None
+    # End date is inclusive: everything before the following day
+    end_day = (date_range[-1] + timedelta(days=1)).isoformat() if len(date_range) > 0 else None
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        summary = user_summary(conn, user_id, start_day, end_day)
+
+        if not summary['transactions']:
+            st.info("No predictions recorded for this period.")
+        else:
+            metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+            metric_col1.metric("Transactions", f"{summary['transactions']:,}")
+            metric_col2.metric("Flagged as fraud", f"{summary['fraud']:,}")
+            metric_col3.metric("Fraud rate", f"{summary['fraud_rate']:.2%}")
+            metric_col4.metric("Mean fraud probability", f"{summary['mean_probability']:.3f}")
+
+            daily_df = pd.DataFrame([tuple(row) for row in daily_stats(conn, user_id, start_day, end_day)],
+                                    columns=['Day', 'Transactions', 'Fraud', 'Probability_Sum'])
+            daily_df['Day'] = pd.to_datetime(daily_df['Day'])
+            daily_df['Fraud Rate'] = daily_df['Fraud'] / daily_df['Transactions']
+            daily_df = daily_df.set_index('Day')
+
+            st.subheader("Daily Trend")
+            trend_col1, trend_col2 = st.columns(2)
+            with trend_col1:
+                st.markdown("**Transactions per day**")
+                st.bar_chart(daily_df[['Transactions', 'Fraud']])
+            with trend_col2:
+                st.markdown("**Fraud rate per day**")
+                st.line_chart(daily_df['Fraud Rate'])
+
+            hourly_df = pd.DataFrame([tuple(row) for row in hourly_stats(conn, user_id, start_day, end_day)],
+                                     columns=['Hour', 'Transactions', 'Fraud', 'Probability_Sum'])
+            # 'YYYY-MM-DDTHH' buckets folded onto the hour of day
+            hourly_df['Hour of Day'] = hourly_df['Hour'].str[11:13].astype(int)
+            by_hour = hourly_df.groupby('Hour of Day')[['Transactions', 'Fraud']].sum().reindex(range(24), fill_value=0)
+            by_hour['Fraud Rate'] = (by_hour['Fraud'] / by_hour['Transactions']).fillna(0.0)
+
+            st.subheader("Hour of Day")
+            hour_col1, hour_col2 = st.columns(2)
+            with hour_col1:
+                st.markdown("**Transactions by hour**")
+                st.bar_chart(by_hour[['Transactions', 'Fraud']])
+            with hour_col2:
+                st.markdown("**Fraud rate by hour**")
+                st.line_chart(by_hour['Fraud Rate'])
+
+            st.subheader("Fraud Probability Distribution")
+            bucket_width = 1.0 / PROBABILITY_BUCKETS
+            histogram_df = pd.DataFrame({
+                'Probability': [f"{idx * bucket_width:.1f}–{(idx + 1) * bucket_width:.1f}" for idx in range(PROBABILITY_BUCKETS)],
+                'Transactions': summary['histogram'],
+            }).set_index('Probability')
+            st.bar_chart(histogram_df)
+
+    except sqlite3.Error as e:
+        st.error(f"Error loading analytics: {e}")
+    finally:
+        if conn:
+            conn.close()
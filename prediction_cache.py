@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Bounded LRU Prediction Cache ---
+# Keys are the bytes of the preprocessed (one-hot encoded, scaled) feature vector, so fields
+# the model never sees (Merchant_ID, Device_ID, ...) do not fragment the cache. Values are
+# the model's class-probability rows. The whole cache is dropped when any watched artifact
+# (model / scaler file) changes on disk.
+
+PREDICTION_CACHE_SIZE = 100000
+ARTIFACT_CHECK_INTERVAL_S = 1.0
+
+class PredictionCache:
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, watched_files=()):
+        self.max_size = max_size
+        self.watched_files = list(watched_files)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = self._artifact_fingerprint()
+        self._next_check = time.monotonic() + ARTIFACT_CHECK_INTERVAL_S
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _artifact_fingerprint(self):
+        fingerprint = []
+        for path in self.watched_files:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return fingerprint
+
+    def _check_artifacts(self):
+        # Called with the lock held; stats the files at most once per interval
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + ARTIFACT_CHECK_INTERVAL_S
+        fingerprint = self._artifact_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get_many(self, keys):
+        # Returns a list aligned with keys: the cached value or None
+        results = []
+        with self._lock:
+            self._check_artifacts()
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                results.append(value)
+        return results
+
+    def put_many(self, keys, values):
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,57 @@
+# --- Table Definitions ---
+# DDL for tables that belong to feature modules, kept free of imports so utils.py can list
+# them in SCHEMA_MIGRATIONS without loading those modules (and their ML dependencies).
+
+PROBABILITY_BUCKETS = 10
+histogram_columns = [f'hist_{bucket}' for bucket in range(PROBABILITY_BUCKETS)]
+
+AGGREGATE_TABLES = {
+    'user_daily_stats': ('day', 10, histogram_columns),
+    'user_hourly_stats': ('hour', 13, []),
+}
+
+def aggregate_create_sql(table, bucket_column, extra_columns):
+    extra = ''.join(f", {column} INTEGER NOT NULL DEFAULT 0" for column in extra_columns)
+    return (f"CREATE TABLE IF NOT EXISTS {table} (user_id INTEGER NOT NULL, {bucket_column} TEXT NOT NULL, "
+            f"transactions INTEGER NOT NULL, fraud INTEGER NOT NULL, probability_sum REAL NOT NULL{extra}, "
+            f"PRIMARY KEY (user_id, {bucket_column})) WITHOUT ROWID")
+
+def aggregate_select_sql(bucket_length, extra_columns, where=''):
+    # CAST truncates like int() in user_aggregates.probability_bucket, so rebuilt and incremental
+    # values agree
+    histogram = ''.join(f", SUM(MIN(CAST(probability * {PROBABILITY_BUCKETS} AS INTEGER), {PROBABILITY_BUCKETS - 1}) = {idx})"
+                        for idx in range(len(extra_columns)))
+    return (f"SELECT user_id, substr(timestamp, 1, {bucket_length}), COUNT(*), SUM(prediction = 'Fraud'), "
+            f"SUM(probability){histogram} FROM transactions {where} GROUP BY 1, 2")
+
+def aggregate_insert_sql(table, bucket_column, extra_columns):
+    columns = ['user_id', bucket_column, 'transactions', 'fraud', 'probability_sum'] + extra_columns
+    return f"INSERT INTO {table} ({', '.join(columns)})"
+
+# Per-user daily/hourly aggregates (user_aggregates.py): create the tables and backfill them from existing rows
+AGGREGATE_MIGRATION = [
+    statement
+    for table, (bucket_column, bucket_length, extra_columns) in AGGREGATE_TABLES.items()
+    for statement in (
+        aggregate_create_sql(table, bucket_column, extra_columns),
+        f"{aggregate_insert_sql(table, bucket_column, extra_columns)} {aggregate_select_sql(bucket_length, extra_columns)}",
+    )
+]
+
+# Stored shadow-variant decisions next to the primary's, for offline comparison (model_variants.py)
+SHADOW_MIGRATION = [
+    "CREATE TABLE IF NOT EXISTS shadow_predictions ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, variant TEXT NOT NULL, timestamp TEXT NOT NULL, "
+    "primary_prediction TEXT NOT NULL, primary_probability REAL NOT NULL, "
+    "prediction TEXT NOT NULL, probability REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_shadow_predictions_variant_timestamp ON shadow_predictions (variant, timestamp)",
+]
+
+# Row keys for joining shadow decisions back to transactions and labels: the caller's
+# Transaction_ID when the records carry one, and a key of the model inputs otherwise
+SHADOW_KEY_MIGRATION = [
+    "ALTER TABLE shadow_predictions ADD COLUMN transaction_id TEXT",
+    "ALTER TABLE shadow_predictions ADD COLUMN input_key TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_shadow_predictions_transaction_id ON shadow_predictions (transaction_id)",
+    "CREATE INDEX IF NOT EXISTS idx_shadow_predictions_input_key ON shadow_predictions (input_key)",
+]
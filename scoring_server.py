@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+from datetime import datetime
+
+import metrics
+from feature_engine import SERVER_FEATURE_STATE_PATH, STREAM_FEATURES, enrich_records, feature_key, get_feature_engine
+# Reuses the model, scaler and feature definitions from the inference core
+from inference import (predict_transactions, get_model, get_prediction_cache, get_cascade, cascade_enabled, model_version,
+                       get_variant_registry, categorical_cols_for_ohe, numerical_cols_to_scale)
+
+# --- Headless Scoring Service ---
+# A minimal HTTP/JSON server on asyncio. Concurrent requests are collected into
+# micro-batches (bounded by max batch size and max wait time) and scored with one
+# vectorized predict_transactions call off the event loop.
+#
+#   POST /score    body: one transaction object, or {"transactions": [ ... ]}
+#                  Records carrying a Card_ID/Device_ID/User_ID update the streaming feature
+#                  engine, which fills in any velocity/recency fields they leave out. Only
+#                  requests that passed validation and were admitted to the queue update it.
+#   GET  /health   queue depth, batching, prediction-cache and model-variant counters
+#   GET  /metrics  stage latency / batch size histograms in Prometheus text format
+
+required_fields = ['Transaction_Date', 'Transaction_Time'] + numerical_cols_to_scale + categorical_cols_for_ohe
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+SERVER_BATCH_SIZE = metrics.histogram(
+    'fraud_server_batch_size', 'Records per micro-batch', buckets=metrics.BATCH_SIZE_BUCKETS)
+SERVER_QUEUE_WAIT_SECONDS = metrics.histogram(
+    'fraud_server_queue_wait_seconds', 'Time from enqueue until the micro-batch starts scoring')
+SERVER_REQUEST_SECONDS = metrics.histogram(
+    'fraud_server_request_seconds', 'HTTP request handling time', label_names=('path',))
+
+class QueueFullError(Exception):
+    pass
+
+class MicroBatcher:
+    def __init__(self, max_batch_size=256, max_wait_ms=5.0, max_queue_depth=10000):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize=max_queue_depth)
+        self.batches_scored = 0
+        self.records_scored = 0
+        self.records_rejected = 0
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    def submit(self, records):
+        # Backpressure: reject the whole request up front if it would overflow the queue
+        if self.queue.maxsize - self.queue.qsize() < len(records):
+            self.records_rejected += len(records)
+            raise QueueFullError(f"Scoring queue is full ({self.queue.qsize()} pending)")
+        loop = asyncio.get_running_loop()
+        futures = []
+        enqueued_at = time.perf_counter()
+        for record in records:
+            future = loop.create_future()
+            self.queue.put_nowait((record, future, enqueued_at))
+            futures.append(future)
+        return futures
+
+    async def _collect_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Drain whatever is already queued without waiting
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            if metrics.is_enabled():
+                started_at = time.perf_counter()
+                metrics.observe(SERVER_BATCH_SIZE, len(batch))
+                for _, _, enqueued_at in batch:
+                    metrics.observe(SERVER_QUEUE_WAIT_SECONDS, started_at - enqueued_at)
+            # Enrichment runs once per admitted record, on the executor: it also writes the feature
+            # engine's periodic snapshot, which must not block the event loop
+            results = await loop.run_in_executor(None, enrich_batch, [record for record, _, _ in batch])
+            scorable = [idx for idx, record in enumerate(results) if not isinstance(record, Exception)]
+            scored = await self._score(loop, [results[idx] for idx in scorable])
+            for idx, result in zip(scorable, scored):
+                results[idx] = result
+            for (_, future, _), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self.batches_scored += 1
+            self.records_scored += len(batch)
+
+    async def _score(self, loop, records):
+        # One result (or exception) per record. Records are validated on arrival, so a failing batch
+        # is rare; it is halved until the bad records are isolated instead of rescored row by row.
+        if not records:
+            return []
+        try:
+            labels, probabilities = await loop.run_in_executor(None, predict_transactions, records)
+            return [(label, float(prob)) for label, prob in zip(labels, probabilities)]
+        except Exception as e:
+            if len(records) == 1:
+                return [e]
+            middle = len(records) // 2
+            return await self._score(loop, records[:middle]) + await self._score(loop, records[middle:])
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.queue.maxsize,
+            'batches_scored': self.batches_scored,
+            'records_scored': self.records_scored,
+            'records_rejected': self.records_rejected,
+            'mean_batch_size': round(self.records_scored / self.batches_scored, 2) if self.batches_scored else 0.0,
+        }
+
+# --- HTTP Handling ---
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def http_response(status, payload, keep_alive=True, content_type="application/json"):
+    # Text payloads (the metrics page) are sent as-is, everything else as JSON
+    body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+    headers = [
+        f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    return ("\r\n".join(headers) + "\r\n\r\n").encode() + body
+
+def enrich_batch(records):
+    # Fills in stream features from the server's own feature state; a failing record gets its exception
+    engine = get_feature_engine(SERVER_FEATURE_STATE_PATH)
+    enriched = []
+    for record in records:
+        try:
+            enriched.append(enrich_records([record], engine)[0])
+        except Exception as e:
+            enriched.append(e)
+    return enriched
+
+def field_type_error(record):
+    # Mirrors what build_feature_matrix accepts; stream features left out are filled in later
+    for field in numerical_cols_to_scale:
+        value = record.get(field)
+        if value is None and field in STREAM_FEATURES:
+            continue
+        try:
+            if isinstance(value, bool) or not math.isfinite(float(value)):
+                raise ValueError
+        except (TypeError, ValueError):
+            return f"{field} must be a finite number"
+    for field in categorical_cols_for_ohe:
+        if not isinstance(record.get(field), str):
+            return f"{field} must be a string"
+    try:
+        datetime.strptime(f"{record['Transaction_Date']} {record['Transaction_Time']}", '%m/%d/%Y %H:%M')
+    except (TypeError, ValueError):
+        return "Transaction_Date and Transaction_Time must be 'MM/DD/YYYY' and 'HH:MM' strings"
+    return None
+
+def parse_transactions(body):
+    payload = json.loads(body)
+    is_batch = isinstance(payload, dict) and 'transactions' in payload
+    records = payload['transactions'] if is_batch else [payload]
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError("Expected a transaction object or {\"transactions\": [...]}")
+    # Validation only: the streaming feature state is updated once the records are admitted to the queue
+    for idx, record in enumerate(records):
+        missing = [field for field in required_fields if field not in record and field not in STREAM_FEATURES]
+        if missing:
+            raise ValueError(f"Transaction {idx} is missing fields: {', '.join(missing)}")
+        missing = [field for field in STREAM_FEATURES if record.get(field) is None]
+        if missing and feature_key(record) is None:
+            raise ValueError(f"Transaction {idx} is missing fields (and has no Card_ID/Device_ID/User_ID "
+                             f"to derive them from): {', '.join(missing)}")
+        type_error = field_type_error(record)
+        if type_error:
+            raise ValueError(f"Transaction {idx}: {type_error}")
+    return records, is_batch
+
+async def handle_score(batcher, body):
+    try:
+        records, is_batch = parse_transactions(body)
+    except (ValueError, TypeError, KeyError) as e:
+        return 400, {'error': str(e)}
+    except Exception as e:
+        return 500, {'error': f"Could not read the request: {e}"}
+    try:
+        futures = batcher.submit(records)
+    except QueueFullError as e:
+        return 503, {'error': str(e)}
+    outcomes = await asyncio.gather(*futures, return_exceptions=True)
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            results.append({'error': str(outcome)})
+        else:
+            results.append({'prediction': outcome[0], 'probability': outcome[1]})
+    if not is_batch:
+        return (400 if 'error' in results[0] else 200), results[0]
+    return 200, {'results': results}
+
+ROUTED_PATHS = ('/score', '/health', '/metrics')
+
+async def route_request(batcher, method, path, body):
+    # Returns (status, payload, content type)
+    if path == '/score' and method == 'POST':
+        status, payload = await handle_score(batcher, body)
+        return status, payload, "application/json"
+    if path == '/score':
+        return 405, {'error': 'Use POST'}, "application/json"
+    if path == '/health':
+        return 200, {**batcher.stats(), 'model_version': model_version(), 'prediction_cache': get_prediction_cache().stats(),
+                     'feature_engine': get_feature_engine(SERVER_FEATURE_STATE_PATH).stats(),
+                     'cascade': get_cascade().stats() if cascade_enabled() else None,
+                     'variants': get_variant_registry().stats() if get_variant_registry() else None}, "application/json"
+    if path == '/metrics':
+        return 200, metrics.render_prometheus(), PROMETHEUS_CONTENT_TYPE
+    return 404, {'error': f'Unknown path {path}'}, "application/json"
+
+async def handle_connection(batcher, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = headers.get('connection', '').lower() != 'close'
+
+            content_length = int(headers.get('content-length', 0))
+            if content_length > MAX_BODY_BYTES:
+                writer.write(http_response(413, {'error': 'Request body too large'}, keep_alive=False))
+                await writer.drain()
+                break
+            body = await reader.readexactly(content_length) if content_length else b''
+
+            # Unknown paths share one label so clients cannot grow the label set without bound
+            path_label = path if path in ROUTED_PATHS else 'other'
+            with metrics.timer(SERVER_REQUEST_SECONDS, path_label):
+                status, payload, content_type = await route_request(batcher, method, path, body)
+
+            writer.write(http_response(status, payload, keep_alive, content_type))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, max_batch_size, max_wait_ms, max_queue_depth):
+    get_model()  # load artifacts before accepting traffic rather than on the first request
+    get_variant_registry()
+    get_feature_engine(SERVER_FEATURE_STATE_PATH)
+    batcher = MicroBatcher(max_batch_size, max_wait_ms, max_queue_depth)
+    batcher.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(batcher, r, w), host, port)
+    print(f"Scoring service listening on http://{host}:{port} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms, queue depth {max_queue_depth})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless fraud scoring service with micro-batching")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-queue-depth', type=int, default=10000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch_size, args.max_wait_ms, args.max_queue_depth))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,94 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# --- Synthetic Transaction Generator ---
+# Produces rows with the card_fraud.csv schema (same columns, order, value ranges, date/time
+# formats and category vocabularies) for benchmarks and load tests, at any size and without
+# shipping real data. Output is deterministic for a given seed and chunk size.
+
+CARD_FRAUD_COLUMNS = [
+    'Transaction_ID', 'User_ID', 'Transaction_Amount', 'Transaction_Date', 'Transaction_Time',
+    'Transaction_Location', 'Merchant_ID', 'Device_ID', 'Card_Type', 'Transaction_Currency',
+    'Transaction_Status', 'Previous_Transaction_Count', 'Distance_Between_Transactions_km',
+    'Time_Since_Last_Transaction_min', 'Authentication_Method', 'Transaction_Velocity',
+    'Transaction_Category', 'isFraud'
+]
+
+CATEGORY_VOCABULARIES = {
+    'Transaction_Location': ['Andijan', 'Bukhara', 'Fergana', 'Jizzakh', 'Kashkadarya', 'Khorezm', 'Namangan',
+                             'Navoiy', 'Samarkand', 'Sirdarya', 'Surkhandarya', 'Tashkent'],
+    'Card_Type': ['Humo', 'UzCard', 'Visa'],
+    'Transaction_Currency': ['UZS', 'USD'],
+    'Transaction_Status': ['Failed', 'Pending', 'Reversed', 'Successful'],
+    'Authentication_Method': ['2FA', 'Biometric', 'Password'],
+    'Transaction_Category': ['Cash In', 'Cash Out', 'Payment', 'Transfer'],
+}
+
+SYNTHETIC_N_USERS = 5000
+SYNTHETIC_N_MERCHANTS = 1000
+SYNTHETIC_N_DEVICES = 2000
+SYNTHETIC_FRAUD_RATE = 0.05
+SYNTHETIC_START_DATE = '2023-01-01'
+SYNTHETIC_DAYS = 365
+SYNTHETIC_CHUNK_SIZE = 100000
+
+def generate_transactions(n_rows, seed=0, start_id=0, fraud_rate=SYNTHETIC_FRAUD_RATE):
+    """Return a DataFrame of n_rows synthetic transactions in card_fraud.csv column order."""
+    rng = np.random.default_rng(seed)
+    is_fraud = rng.random(n_rows) < fraud_rate
+
+    # Fraud rows skew towards long distances, high velocity and short gaps, so the model has
+    # both classes to score and the label is not pure noise
+    distance = np.where(is_fraud, rng.uniform(1500, 5000, n_rows), rng.uniform(0, 5000, n_rows))
+    velocity = np.where(is_fraud, rng.integers(5, 11, n_rows), rng.integers(1, 11, n_rows))
+    minutes_since_last = np.where(is_fraud, rng.integers(1, 120, n_rows), rng.integers(1, 1441, n_rows))
+
+    dates = pd.Timestamp(SYNTHETIC_START_DATE) + pd.to_timedelta(rng.integers(0, SYNTHETIC_DAYS, n_rows), unit='D')
+    hours = rng.integers(0, 24, n_rows)
+    minutes = rng.integers(0, 60, n_rows)
+    times = pd.Series(hours).map('{:02d}'.format) + ':' + pd.Series(minutes).map('{:02d}'.format)
+
+    data = {
+        'Transaction_ID': np.arange(start_id, start_id + n_rows),
+        'User_ID': rng.integers(1, SYNTHETIC_N_USERS + 1, n_rows),
+        'Transaction_Amount': np.round(rng.lognormal(13.5, 1.5, n_rows), 2),
+        'Transaction_Date': dates.strftime('%m/%d/%Y'),
+        'Transaction_Time': times.to_numpy(),
+        'Merchant_ID': rng.integers(1, SYNTHETIC_N_MERCHANTS + 1, n_rows),
+        'Device_ID': rng.integers(1, SYNTHETIC_N_DEVICES + 1, n_rows),
+        'Previous_Transaction_Count': rng.integers(1, 51, n_rows),
+        'Distance_Between_Transactions_km': np.round(distance, 2),
+        'Time_Since_Last_Transaction_min': minutes_since_last,
+        'Transaction_Velocity': velocity,
+        'isFraud': is_fraud.astype(np.int8),
+    }
+    for col, vocabulary in CATEGORY_VOCABULARIES.items():
+        data[col] = np.asarray(vocabulary, dtype=object)[rng.integers(0, len(vocabulary), n_rows)]
+    return pd.DataFrame(data, columns=CARD_FRAUD_COLUMNS)
+
+def iter_transaction_chunks(n_rows, seed=0, chunk_size=SYNTHETIC_CHUNK_SIZE):
+    # Each chunk has its own derived seed, so any size is generated in bounded memory
+    seeds = np.random.SeedSequence(seed).spawn((n_rows + chunk_size - 1) // chunk_size)
+    for chunk_idx, chunk_seed in enumerate(seeds):
+        start = chunk_idx * chunk_size
+        yield generate_transactions(min(chunk_size, n_rows - start), seed=chunk_seed, start_id=start)
+
+def write_transactions_csv(path, n_rows, seed=0, chunk_size=SYNTHETIC_CHUNK_SIZE):
+    for chunk_idx, chunk in enumerate(iter_transaction_chunks(n_rows, seed, chunk_size)):
+        chunk.to_csv(path, mode='w' if chunk_idx == 0 else 'a', header=chunk_idx == 0, index=False)
+    return path
+
+def raw_input_records(df):
+    # The raw_input dicts the prediction page builds (everything except IDs and the label)
+    input_cols = [col for col in CARD_FRAUD_COLUMNS if col not in ('Transaction_ID', 'User_ID', 'isFraud')]
+    return df[input_cols].to_dict('records')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic card_fraud.csv-schema file")
+    parser.add_argument('output_csv')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_transactions_csv(args.output_csv, args.rows, args.seed)
+    print(f"Wrote {args.rows:,} synthetic transactions to {args.output_csv}")
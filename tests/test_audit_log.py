@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+import audit_log
+import utils
+from audit_log import AuditLogWriter
+
+# A record the database rejects must fail on its own: the rest of its batch is still written.
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'DB_FILE', str(tmp_path / 'audit.db'))
+    utils.initialize_database()
+    utils.create_user('analyst', 'secret')
+    yield
+    utils.get_connection_pool().close_all()
+
+def _record(user_id, amount):
+    return user_id, '2024-01-01T12:00:00', {'Transaction_Amount': amount}, 'Legit', 0.1
+
+def _stored_amounts():
+    conn = utils.get_db_connection()
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT Transaction_Amount FROM transactions"))
+    finally:
+        conn.close()
+
+def test_bad_record_fails_alone(database):
+    writer = AuditLogWriter(flush_size=1000, flush_interval=60.0)
+    for amount in range(10):
+        writer.log_prediction(*_record(1, float(amount)))
+        if amount == 4:
+            writer.log_prediction(*_record(999, 99.0))   # no such user: foreign key violation
+    assert writer.flush()
+    stats = writer.stats()
+    assert (stats['written'], stats['failed']) == (10, 1)
+    assert 'FOREIGN KEY' in stats['last_error']
+    assert _stored_amounts() == [float(amount) for amount in range(10)]
+
+def test_busy_database_is_retried(database, monkeypatch):
+    insert_transactions = utils.insert_transactions
+    calls = []
+
+    def busy_once(conn, rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        insert_transactions(conn, rows)
+
+    monkeypatch.setattr(utils, 'insert_transactions', busy_once)
+    monkeypatch.setattr(audit_log, 'AUDIT_BUSY_BACKOFF_S', 0.0)
+    writer = AuditLogWriter(flush_size=1000, flush_interval=60.0)
+    for amount in range(3):
+        writer.log_prediction(*_record(1, float(amount)))
+    assert writer.flush()
+    assert calls == [3, 3]
+    assert (writer.stats()['written'], writer.stats()['failed']) == (3, 0)
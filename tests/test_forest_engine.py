@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from forest_engine import export_forest, load_forest, verify_parity
+from inference import build_feature_matrix, final_model_features, numerical_cols_to_scale
+from synthetic_data import generate_transactions
+
+# The flat-array engine must reproduce sklearn's probabilities exactly, not approximately:
+# a tiny forest trained on synthetic rows is exported and compared bit for bit.
+
+@pytest.fixture(scope='module')
+def forest_and_rows():
+    train = generate_transactions(3000, seed=1)
+    scaler = StandardScaler().fit(train[numerical_cols_to_scale])
+    X_train = pd.DataFrame(build_feature_matrix(train, scaler), columns=final_model_features)
+    model = RandomForestClassifier(n_estimators=12, min_samples_leaf=2, random_state=0).fit(X_train, train['isFraud'])
+    X = pd.DataFrame(build_feature_matrix(generate_transactions(1000, seed=2), scaler), columns=final_model_features)
+    return model, X
+
+@pytest.mark.parametrize('mmap_mode', [None, 'r'])
+def test_exported_forest_matches_sklearn(tmp_path, forest_and_rows, mmap_mode):
+    model, X = forest_and_rows
+    export_forest(model, str(tmp_path))
+    forest = load_forest(str(tmp_path), mmap_mode=mmap_mode)
+    assert forest.n_estimators == model.n_estimators
+    assert verify_parity(model, forest, X) == (0, 0.0)
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+def test_single_rows_match_sklearn(tmp_path, forest_and_rows):
+    model, X = forest_and_rows
+    forest = export_forest(model, str(tmp_path))
+    for idx in range(20):
+        row = X.iloc[[idx]]
+        np.testing.assert_array_equal(forest.predict_proba(row), model.predict_proba(row))
+
+def test_empty_batch(tmp_path, forest_and_rows):
+    model, X = forest_and_rows
+    forest = export_forest(model, str(tmp_path))
+    assert forest.predict_proba(X.iloc[:0]).shape == (0, len(model.classes_))
@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.preprocessing import StandardScaler
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported
+    resource = None
+
+import dataset
+from fingerprints import file_fingerprint
+from forest_engine import export_forest
+from inference import (CURRENT_VERSION_FILE, MODEL_PATH, MODEL_REGISTRY_DIR, SCALER_PATH, artifact_dir,
+                       build_feature_matrix, categorical_cols_for_ohe, current_model_version,
+                       final_model_features, numerical_cols_to_scale)
+
+# --- Retraining Pipeline ---
+# Scriptable replacement for the notebook session:
+#   1. card_fraud.csv is read through the typed dataset cache (dataset.py), plus any labelled history
+#      exports (User History CSVs with an isFraud column added) read with the same explicit dtypes.
+#   2. An optional random subsample (--max-rows) and a stratified 80/20 train/test split are taken
+#      by row index, so the data is never copied as a whole.
+#   3. StandardScaler is fitted incrementally on the training rows; features are built with
+#      inference.build_feature_matrix, i.e. exactly the preprocessing used for serving.
+#   4. The forest trains on all cores, either in one fit or (--chunk-rows) by warm_start growth:
+#      each chunk of training rows adds --trees-per-chunk trees, so memory is bounded by the chunk.
+#   5. Model, scaler and metadata.json (data sources, parameters, time, peak memory, size, metrics)
+#      go to models/<version>/. --promote points models/CURRENT at it; running apps pick it up.
+
+TRAIN_TEST_SIZE = 0.2
+TRAIN_FEATURE_CHUNK_ROWS = 200000
+label_col = 'isFraud'
+input_cols = ['Transaction_Date', 'Transaction_Time'] + numerical_cols_to_scale + categorical_cols_for_ohe
+
+class TrainingRows:
+    """Labelled rows from the dataset cache followed by history rows, addressed by global row index."""
+
+    def __init__(self, csv_path, history_paths=()):
+        self.sources = []
+        arrays, categories = dataset.load_columns(input_cols + [label_col], csv_path)
+        self.dataset_arrays = arrays
+        self.dataset_categories = {col: np.asarray(values, dtype=object) for col, values in categories.items()}
+        self.n_dataset = len(arrays[label_col])
+        self.sources.append({'path': csv_path, 'rows': self.n_dataset, **file_fingerprint(csv_path)})
+
+        read_dtypes = {col: str for col in input_cols if dataset.CARD_FRAUD_SCHEMA[col] == 'category'}
+        history_frames = []
+        for path in history_paths:
+            history = pd.read_csv(path, dtype=read_dtypes)
+            if label_col not in history.columns:
+                raise ValueError(f"{path} has no {label_col} column; label exported history before training on it")
+            labelled = history.dropna(subset=[label_col])
+            history_frames.append(labelled[input_cols + [label_col]])
+            self.sources.append({'path': path, 'rows': len(labelled), 'unlabelled_rows_skipped': len(history) - len(labelled),
+                                 **file_fingerprint(path)})
+        self.history = pd.concat(history_frames, ignore_index=True) if history_frames else None
+
+    def __len__(self):
+        return self.n_dataset + (len(self.history) if self.history is not None else 0)
+
+    def labels(self):
+        y = np.asarray(self.dataset_arrays[label_col])
+        if self.history is not None:
+            y = np.concatenate([y, self.history[label_col].to_numpy()])
+        return y.astype(np.int8)
+
+    def take(self, indices):
+        # indices must be sorted; returns (raw column dict, labels)
+        split = np.searchsorted(indices, self.n_dataset)
+        dataset_idx, history_idx = indices[:split], indices[split:] - self.n_dataset
+        columns = {}
+        for col in input_cols + [label_col]:
+            values = np.asarray(self.dataset_arrays[col][dataset_idx])
+            if col in self.dataset_categories:
+                values = self.dataset_categories[col][values]
+            if len(history_idx):
+                values = np.concatenate([values, self.history[col].to_numpy()[history_idx]])
+            columns[col] = values
+        return columns, np.asarray(columns.pop(label_col)).astype(np.int8)
+
+def _iter_chunks(indices, chunk_rows):
+    for start in range(0, len(indices), chunk_rows):
+        yield indices[start:start + chunk_rows]
+
+def split_indices(y, test_size, max_rows, seed):
+    rng = np.random.default_rng(seed)
+    indices = np.arange(len(y))
+    if max_rows and max_rows < len(indices):
+        indices = np.sort(rng.choice(indices, max_rows, replace=False))
+    # Stratified split: the same test fraction of each class
+    test_mask = np.zeros(len(indices), dtype=bool)
+    for label in np.unique(y[indices]):
+        label_positions = np.flatnonzero(y[indices] == label)
+        n_test = int(round(len(label_positions) * test_size))
+        test_mask[rng.choice(label_positions, n_test, replace=False)] = True
+    return indices[~test_mask], indices[test_mask]
+
+def fit_scaler(rows, train_idx, chunk_rows):
+    scaler = StandardScaler()
+    for chunk_idx in _iter_chunks(train_idx, chunk_rows):
+        columns, _ = rows.take(chunk_idx)
+        scaler.partial_fit(pd.DataFrame({col: columns[col] for col in numerical_cols_to_scale},
+                                        columns=numerical_cols_to_scale))
+    return scaler
+
+def build_features(rows, indices, scaler, chunk_rows):
+    features, labels = [], []
+    for chunk_idx in _iter_chunks(indices, chunk_rows):
+        columns, y = rows.take(chunk_idx)
+        features.append(build_feature_matrix(columns, scaler=scaler))
+        labels.append(y)
+    return np.concatenate(features), np.concatenate(labels)
+
+def train_forest(rows, train_idx, scaler, params, chunk_rows=None, trees_per_chunk=None, seed=42):
+    if not chunk_rows:
+        X, y = build_features(rows, train_idx, scaler, TRAIN_FEATURE_CHUNK_ROWS)
+        model = RandomForestClassifier(**params, random_state=seed, n_jobs=-1)
+        model.fit(pd.DataFrame(X, columns=final_model_features), y)
+        return model
+
+    # warm_start growth: every fit() keeps the existing trees and adds the new ones on this chunk.
+    # Training rows are shuffled first so every chunk is a sample of the whole set.
+    shuffled = np.random.default_rng(seed).permutation(train_idx)
+    model = RandomForestClassifier(**{**params, 'n_estimators': 0}, warm_start=True, random_state=seed, n_jobs=-1)
+    for chunk_idx in _iter_chunks(shuffled, chunk_rows):
+        X, y = build_features(rows, np.sort(chunk_idx), scaler, TRAIN_FEATURE_CHUNK_ROWS)
+        if len(np.unique(y)) < 2:
+            print(f"Skipping a chunk of {len(y)} rows with a single class", file=sys.stderr)
+            continue
+        model.n_estimators += trees_per_chunk
+        model.fit(pd.DataFrame(X, columns=final_model_features), y)
+    if model.n_estimators == 0:
+        raise ValueError("No chunk contained both classes; use larger --chunk-rows")
+    return model
+
+def evaluate(model, rows, test_idx, scaler):
+    fraud_col = list(model.classes_).index(1)
+    proba, labels = [], []
+    for chunk_idx in _iter_chunks(test_idx, TRAIN_FEATURE_CHUNK_ROWS):
+        columns, y = rows.take(chunk_idx)
+        X = pd.DataFrame(build_feature_matrix(columns, scaler=scaler), columns=final_model_features)
+        proba.append(model.predict_proba(X)[:, fraud_col])
+        labels.append(y)
+    proba, y = np.concatenate(proba), np.concatenate(labels)
+    predicted = (proba > 0.5).astype(np.int8)
+    return {
+        'test_rows': int(len(y)),
+        'accuracy': round(float(accuracy_score(y, predicted)), 4),
+        'precision': round(float(precision_score(y, predicted, zero_division=0)), 4),
+        'recall': round(float(recall_score(y, predicted, zero_division=0)), 4),
+        'f1': round(float(f1_score(y, predicted, zero_division=0)), 4),
+        'roc_auc': round(float(roc_auc_score(y, proba)), 4) if len(np.unique(y)) > 1 else None,
+    }
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+def promote(version):
+    if not os.path.exists(os.path.join(artifact_dir(version), os.path.basename(MODEL_PATH))):
+        raise FileNotFoundError(f"No model artifact for version {version}")
+    tmp_path = CURRENT_VERSION_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, CURRENT_VERSION_FILE)
+
+def list_versions():
+    if not os.path.isdir(MODEL_REGISTRY_DIR):
+        return []
+    versions = []
+    for version in sorted(os.listdir(MODEL_REGISTRY_DIR)):
+        meta_path = os.path.join(MODEL_REGISTRY_DIR, version, 'metadata.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                versions.append(json.load(f))
+    return versions
+
+def create_version_dir():
+    # Version names have one-second resolution; runs finishing in the same second get -2, -3, ...
+    # (which still sort after the plain name). makedirs is the atomic claim on a name.
+    base = datetime.now().strftime('%Y%m%d-%H%M%S')
+    version, attempt = base, 1
+    while True:
+        try:
+            os.makedirs(artifact_dir(version))
+            return version, artifact_dir(version)
+        except FileExistsError:
+            attempt += 1
+            version = f"{base}-{attempt}"
+
+def run_training(csv_path, history_paths=(), n_estimators=100, max_depth=None, min_samples_leaf=1,
+                 max_rows=None, chunk_rows=None, trees_per_chunk=10, test_size=TRAIN_TEST_SIZE,
+                 seed=42, export_flat=False, do_promote=False):
+    timings = {}
+    started = time.perf_counter()
+    rows = TrainingRows(csv_path, history_paths)
+    y_all = rows.labels()
+    train_idx, test_idx = split_indices(y_all, test_size, max_rows, seed)
+    timings['load_s'] = time.perf_counter() - started
+
+    start = time.perf_counter()
+    scaler = fit_scaler(rows, train_idx, TRAIN_FEATURE_CHUNK_ROWS)
+    timings['scaler_s'] = time.perf_counter() - start
+
+    params = {'n_estimators': n_estimators, 'max_depth': max_depth, 'min_samples_leaf': min_samples_leaf}
+    start = time.perf_counter()
+    model = train_forest(rows, train_idx, scaler, params, chunk_rows, trees_per_chunk, seed)
+    timings['train_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    evaluation = evaluate(model, rows, test_idx, scaler)
+    timings['evaluate_s'] = time.perf_counter() - start
+
+    version, out_dir = create_version_dir()
+    model_file = os.path.join(out_dir, os.path.basename(MODEL_PATH))
+    joblib.dump(model, model_file)
+    joblib.dump(scaler, os.path.join(out_dir, os.path.basename(SCALER_PATH)))
+    if export_flat:
+        export_forest(model, os.path.join(out_dir, 'random_forest_flat'))
+    timings['total_s'] = time.perf_counter() - started
+
+    metadata = {
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'sources': rows.sources,
+        'params': {**params, 'max_rows': max_rows, 'chunk_rows': chunk_rows,
+                   'trees_per_chunk': trees_per_chunk if chunk_rows else None,
+                   'test_size': test_size, 'seed': seed},
+        'train_rows': int(len(train_idx)),
+        'n_estimators': len(model.estimators_),
+        'features': final_model_features,
+        'metrics': evaluation,
+        'timings': {name: round(value, 2) for name, value in timings.items()},
+        'peak_memory_mb': peak_memory_mb(),
+        'model_size_mb': round(os.path.getsize(model_file) / 1e6, 2),
+        'previous_version': current_model_version(),
+    }
+    with open(os.path.join(out_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    if do_promote:
+        promote(version)
+    return metadata
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Retrain the fraud model into a versioned artifact")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="Train a new model version")
+    train_parser.add_argument('csv_path', nargs='?', default=dataset.CARD_FRAUD_CSV)
+    train_parser.add_argument('--history', action='append', default=[],
+                              help="Labelled history export CSV to add (repeatable)")
+    train_parser.add_argument('--n-estimators', type=int, default=100)
+    train_parser.add_argument('--max-depth', type=int)
+    train_parser.add_argument('--min-samples-leaf', type=int, default=1)
+    train_parser.add_argument('--max-rows', type=int, help="Train and evaluate on a random subsample")
+    train_parser.add_argument('--chunk-rows', type=int, help="Grow the forest with warm_start, one chunk at a time")
+    train_parser.add_argument('--trees-per-chunk', type=int, default=10)
+    train_parser.add_argument('--test-size', type=float, default=TRAIN_TEST_SIZE)
+    train_parser.add_argument('--seed', type=int, default=42)
+    train_parser.add_argument('--export-flat', action='store_true', help="Also write the flat-array forest export")
+    train_parser.add_argument('--promote', action='store_true', help="Serve the new version immediately")
+
+    promote_parser = subparsers.add_parser('promote', help="Serve an existing version")
+    promote_parser.add_argument('version')
+    subparsers.add_parser('list', help="List trained versions")
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        metadata = run_training(args.csv_path, args.history, args.n_estimators, args.max_depth, args.min_samples_leaf,
+                                args.max_rows, args.chunk_rows, args.trees_per_chunk, args.test_size, args.seed,
+                                args.export_flat, args.promote)
+        print(json.dumps({key: metadata[key] for key in
+                          ('version', 'train_rows', 'n_estimators', 'metrics', 'timings', 'peak_memory_mb', 'model_size_mb')},
+                         indent=2))
+        print(f"Wrote {artifact_dir(metadata['version'])}" + (" (promoted)" if args.promote else ""))
+    elif args.command == 'promote':
+        promote(args.version)
+        print(f"Now serving {args.version}")
+    else:
+        current = current_model_version()
+        for metadata in list_versions():
+            marker = '*' if metadata['version'] == current else ' '
+            print(f"{marker} {metadata['version']}  rows={metadata['train_rows']:,}  trees={metadata['n_estimators']}  "
+                  f"auc={metadata['metrics']['roc_auc']}  recall={metadata['metrics']['recall']}  "
+                  f"size={metadata['model_size_mb']} MB")
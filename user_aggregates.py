@@ -0,0 +1,118 @@
+import argparse
+from collections import defaultdict
+
+from schema import (AGGREGATE_TABLES, PROBABILITY_BUCKETS, aggregate_insert_sql, aggregate_select_sql,
+                    histogram_columns)
+
+# --- Per-User Aggregates ---
+# Summary tables maintained alongside the transactions table, so per-user statistics never scan
+# a user's history:
+#   user_daily_stats   (user_id, day 'YYYY-MM-DD')      counts, fraud count, probability sum and a
+#                                                       PROBABILITY_BUCKETS-bin probability histogram
+#   user_hourly_stats  (user_id, hour 'YYYY-MM-DDTHH')  counts, fraud count, probability sum
+# utils.insert_transactions groups each batch by user and bucket and upserts the deltas in the
+# same SQLite transaction as the rows themselves, so the aggregates are always consistent with the
+# table. Reads are index range scans over one row per user-day (or user-hour). Buckets come from
+# the ISO timestamp prefix, the same strings the history filters compare. `rebuild` recomputes the
+# tables from the transactions table, for backfills and for rows written outside insert_transactions.
+
+bucket_lengths = {bucket_column: bucket_length for bucket_column, bucket_length, _ in AGGREGATE_TABLES.values()}
+
+def probability_bucket(probability):
+    return min(int(probability * PROBABILITY_BUCKETS), PROBABILITY_BUCKETS - 1)
+
+def update_aggregates(conn, rows):
+    """Add a batch of (user_id, timestamp, prediction, probability) rows to the aggregates.
+
+    Runs inside the caller's transaction; one upsert per distinct (user, bucket) in the batch.
+    """
+    daily = defaultdict(lambda: [0, 0, 0.0] + [0] * PROBABILITY_BUCKETS)
+    hourly = defaultdict(lambda: [0, 0, 0.0])
+    for user_id, timestamp, prediction, probability in rows:
+        is_fraud = int(prediction == 'Fraud')
+        for buckets, key in ((daily, (user_id, timestamp[:10])), (hourly, (user_id, timestamp[:13]))):
+            values = buckets[key]
+            values[0] += 1
+            values[1] += is_fraud
+            values[2] += probability
+        daily[(user_id, timestamp[:10])][3 + probability_bucket(probability)] += 1
+
+    for table, buckets in (('user_daily_stats', daily), ('user_hourly_stats', hourly)):
+        bucket_column, _, extra_columns = AGGREGATE_TABLES[table]
+        value_columns = ['transactions', 'fraud', 'probability_sum'] + extra_columns
+        conn.executemany(
+            f"{aggregate_insert_sql(table, bucket_column, extra_columns)} VALUES ({', '.join('?' * (len(value_columns) + 2))}) "
+            f"ON CONFLICT (user_id, {bucket_column}) DO UPDATE SET "
+            + ", ".join(f"{column} = {column} + excluded.{column}" for column in value_columns),
+            [(user_id, bucket, *values) for (user_id, bucket), values in buckets.items()]
+        )
+
+def rebuild_aggregates(conn, user_id=None):
+    # Recomputes all users (or one) from the transactions table in a single transaction
+    where, params = ("WHERE user_id = ?", [user_id]) if user_id is not None else ('', [])
+    with conn:
+        for table, (bucket_column, bucket_length, extra_columns) in AGGREGATE_TABLES.items():
+            conn.execute(f"DELETE FROM {table} {where}", params)
+            conn.execute(f"{aggregate_insert_sql(table, bucket_column, extra_columns)} "
+                         f"{aggregate_select_sql(bucket_length, extra_columns, where)}", params)
+    return conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(transactions), 0) FROM user_daily_stats {where}", params).fetchone()
+
+# --- Queries ---
+def _range_sql(bucket_column, user_id, start=None, end=None):
+    # start inclusive, end exclusive; bucket strings compare like the timestamps they were cut from
+    clauses, params = ["user_id = ?"], [user_id]
+    if start:
+        clauses.append(f"{bucket_column} >= ?")
+        params.append(start[:bucket_lengths[bucket_column]])
+    if end:
+        clauses.append(f"{bucket_column} < ?")
+        params.append(end[:bucket_lengths[bucket_column]])
+    return " AND ".join(clauses), params
+
+def user_summary(conn, user_id, start_day=None, end_day=None):
+    """Totals and probability histogram for a user over [start_day, end_day) ('YYYY-MM-DD' strings)."""
+    where, params = _range_sql('day', user_id, start_day, end_day)
+    row = conn.execute(
+        "SELECT COALESCE(SUM(transactions), 0), COALESCE(SUM(fraud), 0), COALESCE(SUM(probability_sum), 0.0), "
+        + ", ".join(f"COALESCE(SUM({column}), 0)" for column in histogram_columns)
+        + f" FROM user_daily_stats WHERE {where}", params
+    ).fetchone()
+    transactions, fraud, probability_sum = row[0], row[1], row[2]
+    return {
+        'transactions': transactions,
+        'fraud': fraud,
+        'fraud_rate': fraud / transactions if transactions else 0.0,
+        'mean_probability': probability_sum / transactions if transactions else 0.0,
+        'histogram': list(row[3:]),
+    }
+
+def daily_stats(conn, user_id, start_day=None, end_day=None):
+    where, params = _range_sql('day', user_id, start_day, end_day)
+    return conn.execute(
+        f"SELECT day, transactions, fraud, probability_sum FROM user_daily_stats WHERE {where} ORDER BY day", params
+    ).fetchall()
+
+def hourly_stats(conn, user_id, start_hour=None, end_hour=None):
+    where, params = _range_sql('hour', user_id, start_hour, end_hour)
+    return conn.execute(
+        f"SELECT hour, transactions, fraud, probability_sum FROM user_hourly_stats WHERE {where} ORDER BY hour", params
+    ).fetchall()
+
+if __name__ == '__main__':
+    import utils
+
+    parser = argparse.ArgumentParser(description="Maintain the per-user aggregate tables")
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--user-id', type=int, help="Only rebuild this user's rows")
+    parser.add_argument('--db', default=utils.DB_FILE)
+    args = parser.parse_args()
+
+    utils.DB_FILE = args.db
+    utils.initialize_database()
+    conn = utils.get_db_connection()
+    try:
+        buckets, transactions = rebuild_aggregates(conn, args.user_id)
+    finally:
+        conn.close()
+    print(f"Rebuilt {buckets:,} daily buckets covering {transactions:,} transactions")
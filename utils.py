@@ -1,14 +1,192 @@
 import sqlite3
 import hashlib
+import json
+import queue
+import threading
+import metrics
+from schema import AGGREGATE_MIGRATION, SHADOW_KEY_MIGRATION, SHADOW_MIGRATION
+from user_aggregates import update_aggregates, user_summary
 import streamlit as st # Only needed for st.error, consider logging or raising instead for pure utility
 
 # --- Database Functions ---
 DB_FILE = 'app_data.db'
 
+# --- Connection Pool ---
+# Connections are opened once, tuned with the pragmas below and reused. Callers keep the
+# usual get_db_connection() / conn.close() pattern: close() hands the connection back to
+# the pool instead of closing it. sqlite3 caches prepared statements per connection
+# (cached_statements), so repeated queries skip re-parsing as long as the connection lives.
+DB_POOL_SIZE = 8
+DB_CACHED_STATEMENTS = 256
+DB_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",       # readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",     # safe with WAL; fsync at checkpoints instead of every commit
+    "PRAGMA cache_size=-20000",      # ~20 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",      # wait for a competing writer instead of 'database is locked'
+    "PRAGMA foreign_keys=ON",
+]
+
+# --- Query Timing ---
+# Every statement run through a pooled connection is timed per operation (SELECT, INSERT, ...)
+# when metrics are enabled. For SELECTs this is the time to the first row.
+DB_QUERY_SECONDS = metrics.histogram(
+    'fraud_db_query_seconds', 'SQLite statement execution time', label_names=('operation',))
+
+def _sql_operation(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not metrics.is_enabled():
+            return super().execute(sql, parameters)
+        with metrics.timer(DB_QUERY_SECONDS, _sql_operation(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not metrics.is_enabled():
+            return super().executemany(sql, seq_of_parameters)
+        with metrics.timer(DB_QUERY_SECONDS, _sql_operation(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    released = False
+
+    # Connection.execute builds its cursor internally, so route it through TimedCursor explicitly
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        # Idempotent: a second close() must not put the same connection in the pool twice
+        if self.released:
+            return
+        self.released = True
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+class ConnectionPool:
+    def __init__(self, db_file, size=DB_POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        conn.released = False
+        return conn
+
+    def release(self, conn):
+        # Returns True if the connection was kept for reuse
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() >= self.size:
+            return False
+        self._idle.put(conn)
+        return True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, factory=PooledConnection, check_same_thread=False,
+                               cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row  # This enables access to columns by name
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.pool = None
+            sqlite3.Connection.close(conn)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool():
+    # One pool per database file, so tests/tools can point DB_FILE elsewhere
+    with _pools_lock:
+        if DB_FILE not in _pools:
+            _pools[DB_FILE] = ConnectionPool(DB_FILE)
+        return _pools[DB_FILE]
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row  # This enables access to columns by name
-    return conn
+    return get_connection_pool().acquire()
+
+# --- Transaction Input Columns ---
+# Model input fields stored as typed columns next to the raw_input JSON, so history queries
+# can filter and page in SQL without decoding every blob. Names match the raw input keys.
+TRANSACTION_INPUT_COLUMNS = [
+    ('Transaction_Amount', 'REAL'),
+    ('Transaction_Date', 'TEXT'),
+    ('Transaction_Time', 'TEXT'),
+    ('Transaction_Location', 'TEXT'),
+    ('Card_Type', 'TEXT'),
+    ('Transaction_Currency', 'TEXT'),
+    ('Transaction_Status', 'TEXT'),
+    ('Previous_Transaction_Count', 'INTEGER'),
+    ('Distance_Between_Transactions_km', 'REAL'),
+    ('Time_Since_Last_Transaction_min', 'INTEGER'),
+    ('Authentication_Method', 'TEXT'),
+    ('Transaction_Velocity', 'INTEGER'),
+    ('Transaction_Category', 'TEXT'),
+    ('Merchant_ID', 'TEXT'),
+    ('Device_ID', 'TEXT'),
+]
+transaction_input_names = [name for name, _ in TRANSACTION_INPUT_COLUMNS]
+
+# --- Schema Migrations ---
+# Applied in order by initialize_database; PRAGMA user_version records how many have run.
+SCHEMA_MIGRATIONS = [
+    # 1: history queries filter by user and order by time
+    [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_timestamp ON transactions (user_id, timestamp)",
+    ],
+    # 2: typed input columns, backfilled from the existing raw_input JSON
+    [f"ALTER TABLE transactions ADD COLUMN {name} {sql_type}" for name, sql_type in TRANSACTION_INPUT_COLUMNS] + [
+        "UPDATE transactions SET " + ", ".join(
+            f"{name} = json_extract(raw_input, '$.{name}')" for name in transaction_input_names
+        ),
+    ],
+    # 3: per-user daily/hourly aggregate tables (user_aggregates.py), backfilled from existing rows
+    AGGREGATE_MIGRATION,
+    # 4: shadow-variant decisions stored next to the primary's (model_variants.py)
+    SHADOW_MIGRATION,
+    # 5: transaction id and input key on shadow rows, to join them back to transactions and labels
+    SHADOW_KEY_MIGRATION,
+]
+
+def apply_migrations(conn):
+    # Each migration and its user_version bump commit together. The explicit BEGIN matters:
+    # sqlite3 opens no implicit transaction before DDL, so each ALTER TABLE would otherwise
+    # commit on its own and a failure part-way would be retried on top of its own leftovers.
+    # IMMEDIATE takes the write lock up front, so a second process waits and then sees the new version.
+    for version, statements in enumerate(SCHEMA_MIGRATIONS, start=1):
+        if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
 
 def initialize_database():
     conn = None
@@ -37,6 +215,7 @@ def initialize_database():
         ''')
 
         conn.commit()
+        apply_migrations(conn)
     except sqlite3.Error as e:
         # In a utility file, it's better to log this or propagate the error
         # For Streamlit apps, st.error might be acceptable if directly called from app context
@@ -87,3 +266,71 @@ def reset_user_password(username, new_password):
         return False
     finally:
         conn.close()
+
+def insert_transactions(conn, rows):
+    # rows: iterable of (user_id, timestamp, raw_input_dict, prediction, probability) tuples.
+    # raw_input is stored both as JSON and in the typed input columns.
+    # All rows are written with one executemany inside a single transaction, together with
+    # the matching per-user aggregate updates.
+    rows = list(rows)
+    columns = ['user_id', 'timestamp', 'raw_input', 'prediction', 'probability'] + transaction_input_names
+    sql = f"INSERT INTO transactions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    with conn:
+        conn.executemany(sql, (
+            (user_id, timestamp, json.dumps(raw_input), prediction, probability,
+             *[raw_input.get(name) for name in transaction_input_names])
+            for user_id, timestamp, raw_input, prediction, probability in rows
+        ))
+        update_aggregates(conn, ((user_id, timestamp, prediction, probability)
+                                 for user_id, timestamp, _, prediction, probability in rows))
+
+# --- Transaction History Queries ---
+HISTORY_SELECT_COLUMNS = ['timestamp AS Timestamp', 'prediction AS Prediction', 'probability AS Probability'] + \
+                         transaction_input_names
+
+def history_filter_sql(user_id, start_timestamp=None, end_timestamp=None, prediction=None, min_probability=None):
+    # Timestamps are ISO strings, so range filters compare lexicographically on the index
+    clauses = ["user_id = ?"]
+    params = [user_id]
+    if start_timestamp:
+        clauses.append("timestamp >= ?")
+        params.append(start_timestamp)
+    if end_timestamp:
+        clauses.append("timestamp < ?")
+        params.append(end_timestamp)
+    if prediction:
+        clauses.append("prediction = ?")
+        params.append(prediction)
+    if min_probability is not None:
+        clauses.append("probability >= ?")
+        params.append(min_probability)
+    return " AND ".join(clauses), params
+
+def _is_day(timestamp):
+    return timestamp is None or len(timestamp) == 10
+
+def count_transactions(conn, user_id, **filters):
+    # Returns (total rows, fraud rows) matching the filters. Whole-day ranges without other
+    # filters are answered from the daily aggregates instead of counting the rows.
+    if not filters.get('prediction') and filters.get('min_probability') is None and \
+            _is_day(filters.get('start_timestamp')) and _is_day(filters.get('end_timestamp')):
+        summary = user_summary(conn, user_id, filters.get('start_timestamp'), filters.get('end_timestamp'))
+        return summary['transactions'], summary['fraud']
+    where, params = history_filter_sql(user_id, **filters)
+    row = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(prediction = 'Fraud'), 0) FROM transactions WHERE {where}", params
+    ).fetchone()
+    return row[0], row[1]
+
+def fetch_transactions_page(conn, user_id, page_size, before=None, **filters):
+    # Keyset pagination, newest first. `before` is the (timestamp, id) of the last row of the
+    # previous page; each page is an index range scan instead of an OFFSET skip.
+    where, params = history_filter_sql(user_id, **filters)
+    if before is not None:
+        where += " AND (timestamp, id) < (?, ?)"
+        params += list(before)
+    return conn.execute(
+        f"SELECT id, {', '.join(HISTORY_SELECT_COLUMNS)} FROM transactions WHERE {where} "
+        "ORDER BY timestamp DESC, id DESC LIMIT ?",
+        params + [page_size]
+    ).fetchall()